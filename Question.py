@@ -1,92 +1,140 @@
-import random
-import requests
 import time
-from datetime import datetime
+
+STARTUP_TIME = time.perf_counter()  # 起動時間計測の基準 (最初の問題表示まで)
+
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import messagebox
-import os
-import json
 
-# 設定
-# スクリプトの場所を基準に設定ファイルを読み込む
-script_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(script_dir, 'ログ・設定', 'config.json')
-
-with open(config_path, 'r', encoding='utf-8') as f:
-    config = json.load(f)
-
-NOTION_API_KEY = config['NOTION_API_KEY']
-DATABASE_ID = config['DATABASE_ID']
-DEBUG = config.get('DEBUG', False)
-QUESTION_TYPE = config.get('TYPE', '掛け算')
-LOG_FILE = os.path.join(os.path.dirname(config_path), config.get('LOG_FILE', 'activity_log.json'))
-NUM_DIGITS = config.get('NUM_DIGITS', 3)
-ADD_QUESTIONS_ON_MISTAKE = config.get('ADD_QUESTIONS_ON_MISTAKE', 1)
-NUM_QUESTIONS = config.get('NUM_QUESTIONS', 10)
-MAX_QUESTIONS = config.get('MAX_QUESTIONS', 100)
-
-# Notion API設定
-HEADERS = {
-    'Notion-Version': '2022-06-28',
-    'Authorization': f'Bearer {NOTION_API_KEY}',
-    'Content-Type': 'application/json',
-}
-URL_PAGES = 'https://api.notion.com/v1/pages'
-URL_DATABASE = 'https://api.notion.com/v1/databases'
+from buffer_store import BufferStore
+from quiz_engine import QuizEngine
+from records import BUFFER_FORMAT, from_columns, to_columns
+from settings import get_settings
+from stats import SessionStats
+from tracing import Tracer
 
-class QuizApp:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.root.withdraw()
-        self.questions = []
-        
-    def safe_int(self, value):
-        """安全な整数変換"""
-        return int(value) if value and value.isdigit() else 0
-    
-    def calculate_stats(self):
-        """統計情報を計算"""
-        if not self.questions:
-            return 0, 0, 0
-        
-        times = [q['time'] for q in self.questions]
-        correct_count = len([q for q in self.questions if q['judge'] == '正解'])
-        
-        return (
-            sum(times) / len(times),  # 平均時間
-            correct_count / len(self.questions),  # 正答率
-            sum(times)  # 総時間
-        )
+# Notion API設定 (接続先はNOTION_API_URLで変更可能)
+TABLE_ROWS_PER_BLOCK = 100  # Notionの子要素数の上限 (見出し行を含む)
+SESSION_RELATION = "セッション"  # 共有データベースの問題ページからセッションページへのリレーション
+# STATS_PROPERTIES 有効時にセッションのデータベースへ追加する数値列
+STATS_PROPERTY_NAMES = ["時間(中央値)", "時間(p90)", "時間(p99)", "時間(標準偏差)", "商正答率", "余り正答率"]
+
+class StreamingUploader:
+    """クイズ中に採点済みの問題をバックグラウンドでNotionへ送信"""
+    def __init__(self, app, session_key):
+        self.app = app
+        self.session_key = session_key
+        self.queue = queue.Queue()
+        self.main_page_id = None
+        self.database_id = None
+        self.session_page_id = None  # 共有データベースの場合のみ
+        self.done = []
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, idx, question):
+        """採点済みの問題を送信待ちに追加 (表モードでは終了後にまとめて送るため何もしない)"""
+        if self.app.settings.upload_mode != 'table':
+            self.queue.put((idx, question))
+
+    def _run(self):
+        # メインページ (統計は終了後に更新) と子データベースを先に作成
+        if not self.app.ensure_session_schema():
+            print("バックグラウンド送信を中止しました (終了後にバッファから再送します)")
+            return
+        tracer = self.app.tracer
+        with tracer.span('main_page', session=self.session_key, stream=True) as span:
+            result = self.app.notion_request(self.app.url_pages, self.app.build_main_page(self.session_key))
+            span['ok'] = bool(result)
+        if result:
+            self.main_page_id = result['id']
+            if self.stopping.is_set():
+                return  # 終了処理で途中経過を返した後なので、データベースは作らずバッファに任せる
+            upload_mode = self.app.settings.upload_mode
+            if upload_mode == 'table':
+                return
+            if upload_mode == 'shared':
+                self.database_id = self.app.shared_database(self.app.settings.question_type)
+                self.session_page_id = self.main_page_id
+            else:
+                self.database_id = self.app.create_database(self.main_page_id, self.app.settings.question_type)
+        if not self.database_id:
+            print("バックグラウンド送信を中止しました (終了後にバッファから再送します)")
+            return
 
-    def custom_keypad_dialog(self, title, question, show_r_button=False):
-        """数値入力ダイアログ"""
-        answer = []
-        user_input = None
+        while not self.stopping.is_set():
+            try:
+                idx, question = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # 失敗した問題は終了後にバッファ経由で再送される
+            with tracer.span('question_page', session=self.session_key, idx=idx, stream=True) as span:
+                page = self.app.build_question_page(idx, question, self.database_id, self.session_page_id)
+                span['ok'] = bool(self.app.notion_request(self.app.url_pages, page))
+            if span['ok']:
+                self.done.append(idx)
+            self.queue.task_done()
 
-        def on_char_click(char):
-            answer.append(char)
-            entry_var.set(''.join(answer))
+    def finish(self, timeout):
+        """最大timeout秒だけ送信待ちを消化して停止し、バッファ用の途中経過を返す
 
-        def on_backspace():
-            if answer:
-                answer.pop()
-                entry_var.set(''.join(answer))
+        送信中のリクエストもtimeout秒までしか待たない (NotionClientの再試行・429の待機で数分かかることがあり、
+        その間「完了」が表示されなくなるため)。期限までに終わらなかった問題はdoneに含めずバッファから再送するので、
+        そのリクエストが後から成功していれば問題ページが重複する (メインページの作成中なら同様にメインページが重複する)。
+        """
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and self.thread.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.stopping.set()
+        self.thread.join(max(deadline - time.monotonic(), 0))
+        if self.thread.is_alive():
+            print("送信中のリクエストが終わらないため、残りはバッファから再送します")
 
-        def on_submit():
-            nonlocal user_input
-            user_input = ''.join(answer)
-            keypad.destroy()
+        # 以降にスレッドが書き換えても返す値が変わらないよう先に読み出す
+        main_page_id, database_id, done = self.main_page_id, self.database_id, sorted(self.done)
+        if not main_page_id:
+            return {}
+        progress = {'main_page_id': main_page_id, 'main_page_provisional': True}
+        if database_id:
+            progress.update({'database_id': database_id, 'done': done})
+        return progress
 
-        keypad = tk.Toplevel()
-        keypad.title(title)
+class KeypadWindow:
+    """セッション中使い回す数値入力ウィンドウ (キーボード入力対応)"""
+    def __init__(self, root):
+        self.root = root
+        self.window = None
+        self.show_r_button = None
+        self.answer = []
+        self.submitted = tk.BooleanVar(root, False)
+        self.user_input = None
+        self.first_rendered = None  # 最初の問題を描画した時刻 (起動時間計測用)
+        self.render_time = 0.0  # 直前の問題の表示にかかった秒数
+
+    def _build(self, show_r_button):
+        """ウィンドウとボタンを作成 (セッション中1回だけ)"""
+        self.close()
+        self.show_r_button = show_r_button
+        self.window = keypad = tk.Toplevel(self.root)
         keypad.geometry('500x600')
         keypad.attributes('-topmost', True)
+        keypad.protocol('WM_DELETE_WINDOW', self._on_close)
 
         # UI要素
-        tk.Label(keypad, text=question, font=('Helvetica', 14)).pack(pady=10)
+        self.label = tk.Label(keypad, font=('Helvetica', 14))
+        self.label.pack(pady=10)
+        self.stats_label = tk.Label(keypad, font=('Helvetica', 11), fg='gray30', justify='left')
+        self.stats_label.pack()
         
-        entry_var = tk.StringVar()
-        tk.Entry(keypad, textvariable=entry_var, font=('Helvetica', 18), justify='right').pack(pady=10)
+        self.entry_var = tk.StringVar(keypad)
+        tk.Entry(keypad, textvariable=self.entry_var, font=('Helvetica', 18), justify='right',
+                 state='readonly').pack(pady=10)
 
         # キーパッド
         btn_frame = tk.Frame(keypad)
@@ -110,60 +158,238 @@ class QuizApp:
             for col_idx, btn_text in enumerate(row):
                 cmd = None
                 if btn_text == '⌫':
-                    cmd = on_backspace
+                    cmd = self._on_backspace
                 elif btn_text == 'OK':
-                    cmd = on_submit
-                else: # 数字または'R'
-                    cmd = lambda char=btn_text: on_char_click(char)
+                    cmd = self._on_submit
+                else: # 数字または'余り'
+                    cmd = lambda char=btn_text: self._on_char(char)
                 
                 tk.Button(frame, text=btn_text, command=cmd, width=5, height=2, 
                          font=('Helvetica', 14)).grid(row=0, column=col_idx, padx=5, pady=5)
 
+        # キーボード入力 (数字、Backspace、Enter、r/スペースで余り)
+        keypad.bind('<Key>', self._on_key)
+        keypad.bind('<BackSpace>', lambda e: self._on_backspace())
+        keypad.bind('<Return>', lambda e: self._on_submit())
+        keypad.bind('<KP_Enter>', lambda e: self._on_submit())
         keypad.grab_set()
-        self.root.wait_window(keypad)
-        return user_input
+
+    def _on_char(self, char):
+        self.answer.append(char)
+        self.entry_var.set(''.join(self.answer))
+
+    def _on_backspace(self):
+        if self.answer:
+            self.answer.pop()
+            self.entry_var.set(''.join(self.answer))
+
+    def _on_submit(self):
+        self.user_input = ''.join(self.answer)
+        self.submitted.set(True)
+
+    def _on_key(self, event):
+        if event.char.isdigit():
+            self._on_char(event.char)
+        elif self.show_r_button and event.char in ('r', 'R', ' '):
+            self._on_char('余り')
+
+    def _on_close(self):
+        # 閉じた場合は未回答として扱い、次の問題でウィンドウを作り直す
+        self.user_input = None
+        self.close()
+        self.submitted.set(True)
+
+    def ask(self, title, question, show_r_button=False):
+        """問題を表示して回答を待つ。(入力文字列, 表示から回答までの秒数) を返す"""
+        render_start = time.perf_counter()
+        if self.window is None or show_r_button != self.show_r_button:
+            self._build(show_r_button)
+
+        self.window.title(title)
+        self.label.config(text=question)
+        self.answer = []
+        self.entry_var.set('')
+        self.user_input = None
+        self.submitted.set(False)
+        self.window.focus_force()
+
+        # 実際に描画されてから計測を開始する
+        self.window.update_idletasks()
+        start_time = time.perf_counter()
+        self.render_time = start_time - render_start
+        if self.first_rendered is None:
+            self.first_rendered = start_time
+        self.root.wait_variable(self.submitted)
+        return self.user_input, time.perf_counter() - start_time
+
+    def set_stats(self, text):
+        """ここまでの成績を表示"""
+        if self.window is not None:
+            self.stats_label.config(text=text)
+
+    def close(self):
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+
+class QuizApp:
+    def __init__(self, headless=False, buffer_file=None, settings=None):
+        # headless=True ではウィンドウを作らず、回答はgenerate_problemsのsourceから受け取る
+        self.settings = settings or get_settings()
+        self.headless = headless
+        self.root = None
+        if not headless:
+            self.root = tk.Tk()
+            self.root.withdraw()
+        self.questions = []
+        self.stats = SessionStats()
+        self.streamer = None
+        self.keypad = None if headless else KeypadWindow(self.root)
+        if buffer_file:
+            self.buffer = BufferStore(buffer_file, compact_bytes=self.settings.buffer_compact_bytes)
+        else:
+            self.buffer = BufferStore(self.settings.buffer_path, legacy_path=self.settings.log_path,
+                                      compact_bytes=self.settings.buffer_compact_bytes)
+        self.url_pages = f"{self.settings.notion_api_url}/pages"
+        self.url_database = f"{self.settings.notion_api_url}/databases"
+        self.url_blocks = f"{self.settings.notion_api_url}/blocks"
+        self._notion = None
+        self._notion_lock = threading.Lock()
+        self.schema_ready = not self.settings.stats_properties
+        self._shared_databases = {}  # (セッションのデータベース/問題種) -> 共有データベースのID
+        self._shared_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self.sampler = None
+        self.tracer = Tracer(self.settings.trace_path, self.settings.metrics_path)
+
+    @property
+    def notion(self):
+        """Notionクライアント (requestsの読み込みを含め、最初の送信時まで遅延)"""
+        with self._notion_lock:
+            if self._notion is None:
+                from notion_client import NotionClient
+                settings = self.settings
+                # セッション・問題の2つのプールから同時に使うため、接続数はワーカー数の2倍
+                self._notion = NotionClient(settings.notion_api_key, rate_limit=settings.notion_rate_limit,
+                                            pool_size=settings.upload_workers * 2,
+                                            max_retries=settings.notion_max_retries)
+            return self._notion
+        
+    def calculate_stats(self):
+        """統計情報を計算 (採点ごとに更新済みの値を返す)"""
+        if not self.questions:
+            return 0, 0, 0
+        if self.stats.count != len(self.questions):
+            # generate_problems以外で問題記録が作られた場合は作り直す
+            self.stats = SessionStats.from_questions(self.questions)
+        
+        return (
+            self.stats.mean,  # 平均時間
+            self.stats.accuracy,  # 正答率
+            self.stats.total_time  # 総時間
+        )
+
+    def record_history(self, session_key, questions=None, question_type=None):
+        """完了したセッションをローカル履歴に記録 (questions省略時は実行中のセッション)"""
+        from history import HistoryStore
+
+        try:
+            with self.tracer.span('history'):
+                history = HistoryStore(self.settings.history_path)
+                try:
+                    history.add_session(session_key, question_type or self.settings.question_type,
+                                        self.questions if questions is None else questions)
+                finally:
+                    history.close()
+        except Exception as e:
+            print(f"履歴の記録に失敗しました: {e}")
+
+    def history_stats(self):
+        """ローカル履歴 (他の端末から取り込んだ分を含む) の過去の成績"""
+        from history import HistoryStore
+
+        try:
+            history = HistoryStore(self.settings.history_path)
+            try:
+                since = (datetime.now() - timedelta(days=self.settings.history_days)).strftime('%Y-%m-%d')
+                return history.stats(self.settings.question_type, since=since)
+            finally:
+                history.close()
+        except Exception as e:
+            print(f"履歴の集計に失敗しました: {e}")
+            return None
+
+    def pull_history(self):
+        """Notionの結果を差分取得してローカル履歴に取り込む (失敗時はNone)"""
+        from history import HistoryStore
+        from pull_sync import PullSync
+
+        try:
+            history = HistoryStore(self.settings.history_path)
+            try:
+                with self.tracer.span('pull') as span:
+                    counts = PullSync(self, history).run()
+                    span['ok'] = counts is not None
+            finally:
+                history.close()
+        except Exception as e:
+            print(f"Notionからの取り込みに失敗しました: {e}")
+            return None
+        if counts is None:
+            print("Notionからの取り込みが一部失敗しました (次回再試行します)")
+        elif counts['imported'] or counts['incomplete']:
+            print(f"Notionから取り込み: {counts['imported']}セッション "
+                  f"(記録済み {counts['skipped']}, アップロード途中 {counts['incomplete']})")
+        return counts
 
     def file_operation(self, operation, data=None):
-        """ファイル操作の統一処理"""
+        """ファイル操作の統一処理 (バッファはBufferStoreへの追記で更新)"""
+        with self.tracer.span(f'buffer_{operation}'):
+            return self._file_operation(operation, data)
+
+    def _file_operation(self, operation, data):
         try:
             if operation == 'load':
-                if os.path.exists(LOG_FILE):
-                    with open(LOG_FILE, 'r', encoding='utf-8') as file:
-                        return json.load(file)
-                return {}
+                return self.buffer.load()
+            
+            elif operation == 'append':
+                self.buffer.put_many(data)
+                return True
+            
+            elif operation == 'remove':
+                self.buffer.remove(data)
+                return True
             
             elif operation == 'save':
-                os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-                with open(LOG_FILE, 'w', encoding='utf-8') as file:
-                    json.dump(data, file, indent=4, ensure_ascii=False)
+                self.buffer.replace(data)
                 return True
             
             elif operation == 'delete':
-                if os.path.exists(LOG_FILE):
-                    os.remove(LOG_FILE)
+                self.buffer.clear()
                 return True
                 
         except Exception as e:
             print(f"ファイル操作エラー ({operation}): {e}")
             return {} if operation == 'load' else False
 
-    def notion_request(self, url, data):
+    def notion_request(self, url, data, method='POST'):
         """Notion API リクエストの統一処理"""
+        import requests
+
         try:
-            response = requests.post(url, headers=HEADERS, json=data)
-            response.raise_for_status() # エラーがあれば例外を発生させる
-            return response.json()
+            return self.notion.request(method, url, data)
         except requests.exceptions.RequestException as e:
             print(f"Notion API エラー: {e}")
-            if e.response:
+            if e.response is not None:
                 print(f"レスポンス: {e.response.text}")
             return None
         except Exception as e:
             print(f"Notion リクエストエラー: {e}")
             return None
 
-    def create_database(self, parent_page_id, question_type):
-        """子データベース作成"""
+    @staticmethod
+    def question_schema(question_type):
+        """個別問題のデータベースのプロパティ定義"""
         properties = {
             "問題番号": {"title": {}},
             "問題": {"rich_text": {}},
@@ -190,90 +416,378 @@ class QuizApp:
                 "正答": {"number": {"format": "number"}},
                 "回答": {"number": {"format": "number"}},
             })
+        return properties
 
+    def create_database(self, parent_page_id, question_type):
+        """子データベース作成"""
         database_data = {
             "parent": {"page_id": parent_page_id},
             "title": [{"type": "text", "text": {"content": "個別の問題"}}],
-            "properties": properties
+            "properties": self.question_schema(question_type)
         }
         
-        result = self.notion_request(URL_DATABASE, database_data)
+        with self.tracer.span('create_database') as span:
+            result = self.notion_request(self.url_database, database_data)
+            span['ok'] = bool(result)
         return result['id'] if result else None
 
-    def build_session_data(self, session_key):
-        """セッションデータ構築"""
-        avg_time, correct_rate, total_time = self.calculate_stats()
-        type_name = "デバッグ用" if DEBUG else QUESTION_TYPE
+    def load_notion_cache(self):
+        """NotionのID・スキーマのローカルキャッシュ"""
+        try:
+            with open(self.settings.notion_cache_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_notion_cache(self, cache):
+        path = self.settings.notion_cache_path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(cache, file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"キャッシュの保存に失敗しました: {e}")
+
+    def update_notion_cache(self, section, key, value):
+        """キャッシュの1項目を更新 (読み直してから書き込み、他の項目を消さない)"""
+        with self._cache_lock:
+            cache = self.load_notion_cache()
+            cache.setdefault(section, {})[key] = value
+            self.save_notion_cache(cache)
+
+    def shared_schema(self, question_type):
+        properties = self.question_schema(question_type)
+        properties[SESSION_RELATION] = {"relation": {"database_id": self.settings.database_id, "single_property": {}}}
+        return properties
+
+    def shared_database(self, question_type):
+        """問題種ごとの共有データベースのID (キャッシュになければ検索し、見つからなければ作成)"""
+        key = f"{self.settings.database_id}/{question_type}"
+        with self._shared_lock:
+            if key in self._shared_databases:
+                return self._shared_databases[key]
+            title = f"個別の問題 ({question_type})"
+            schema = self.shared_schema(question_type)
+            cache = self.load_notion_cache()
+            entry = cache.get('shared_databases', {}).get(key)
+
+            if entry is None:
+                result = self.notion_request(f"{self.settings.notion_api_url}/search", {
+                    'query': title, 'filter': {'property': 'object', 'value': 'database'}})
+                if result is None:
+                    return None
+                entry = self._match_shared_database(result.get('results', []), title)
+                if entry is None:
+                    entry = self._create_shared_database(title, schema)
+                    if entry is None:
+                        return None
+            
+            # コード側で列が増えた場合は既存のデータベースに追加
+            missing = {name: prop for name, prop in schema.items() if name not in entry['properties']}
+            if missing:
+                with self.tracer.span('schema', shared=True) as span:
+                    span['ok'] = bool(self.notion_request(f"{self.url_database}/{entry['id']}",
+                                                          {'properties': missing}, method='PATCH'))
+                if not span['ok']:
+                    return None
+                entry['properties'] = sorted(set(entry['properties']) | set(missing))
+
+            self.update_notion_cache('shared_databases', key, entry)
+            self._shared_databases[key] = entry['id']
+            return entry['id']
+
+    def _match_shared_database(self, databases, title):
+        """検索結果から、同じタイトルでセッションのデータベースにリレーションしているものを選ぶ"""
+        session_database = self.settings.database_id.replace('-', '')
+        for database in databases:
+            name = ''.join(t.get('plain_text', '') for t in database.get('title', []))
+            relation = database.get('properties', {}).get(SESSION_RELATION, {}).get('relation', {})
+            if name == title and relation.get('database_id', '').replace('-', '') == session_database:
+                return {'id': database['id'], 'properties': sorted(database['properties'])}
+        return None
+
+    def _create_shared_database(self, title, schema):
+        """共有データベースを作成 (親はSHARED_PARENT_PAGE_ID、未設定ならセッションのデータベースと同じページ)"""
+        parent_page_id = self.settings.shared_parent_page_id
+        if not parent_page_id:
+            database = self.notion_request(f"{self.url_database}/{self.settings.database_id}", None, method='GET')
+            if database is None:
+                return None
+            parent = database.get('parent', {})
+            if parent.get('type') != 'page_id':
+                print("共有データベースの親ページを特定できません (SHARED_PARENT_PAGE_ID を設定してください)")
+                return None
+            parent_page_id = parent['page_id']
+
+        database_data = {
+            "parent": {"page_id": parent_page_id},
+            "title": [{"type": "text", "text": {"content": title}}],
+            "properties": schema
+        }
+        with self.tracer.span('create_database', shared=True) as span:
+            result = self.notion_request(self.url_database, database_data)
+            span['ok'] = bool(result)
+        if not result:
+            return None
+        print(f"共有データベースを作成しました: {title}")
+        return {'id': result['id'], 'properties': sorted(schema)}
+
+    def build_main_page(self, session_key, stats=None, question_type=None, debug=None):
+        """メインページデータ構築 (stats省略時は実行中のセッション)"""
+        if stats is None:
+            self.calculate_stats()  # self.statsを問題記録と揃える
+            stats = self.stats
+        question_type = question_type or self.settings.question_type
+        debug = self.settings.debug if debug is None else debug
+        type_name = "デバッグ用" if debug else question_type
         
-        # メインページデータ
         main_page = {
-            'parent': {'database_id': DATABASE_ID},
+            'parent': {'database_id': self.settings.database_id},
             'properties': {
                 '名前': {'title': [{'text': {'content': session_key}}]},
-                '経過時間': {'number': total_time},
-                "正答率": {"number": correct_rate},
-                "問題数": {"number": len(self.questions)},
+                '経過時間': {'number': stats.total_time},
+                "正答率": {"number": stats.accuracy},
+                "問題数": {"number": stats.count},
                 "問題種": {"select": {"name": type_name}}
             }
         }
-        
-        # 個別問題データ
-        questions = []
-        for idx, q in enumerate(self.questions):
-            properties = {
-                "問題番号": {'title': [{'text': {'content': str(idx + 1)}}]},
-                '問題': {'rich_text': [{'text': {'content': q['question']}}]},
-                "時間": {"number": q['time']},
-                "正誤判定": {"select": {"name": q['judge']}},
-            }
+        if self.settings.stats_properties:
+            division = stats.division_count or None
+            values = [stats.quantile(0.5), stats.quantile(0.9), stats.quantile(0.99), stats.stdev,
+                      division and stats.quotient_correct / division,
+                      division and stats.remainder_correct / division]
+            main_page['properties'].update(
+                {name: {"number": value} for name, value in zip(STATS_PROPERTY_NAMES, values)})
+        return main_page
+
+    @staticmethod
+    def session_relation(session_page_id):
+        """共有データベースの問題ページをセッションページに関連付けるプロパティ"""
+        return {SESSION_RELATION: {"relation": [{"id": session_page_id}]}}
+
+    def build_question_page(self, idx, q, database_id='PLACEHOLDER', session_page_id=None):
+        """個別問題データ構築 (session_page_idは共有データベースの場合のみ)"""
+        properties = {
+            "問題番号": {'title': [{'text': {'content': str(idx + 1)}}]},
+            '問題': {'rich_text': [{'text': {'content': q.question}}]},
+            "時間": {"number": q.time},
+            "正誤判定": {"select": {"name": q.judge}},
+        }
+
+        if q.type == "割り算":
+            properties.update({
+                "正答(商)": {"number": q.correct_quotient},
+                "正答(余)": {"number": q.correct_remainder},
+                "回答(商)": {"number": q.user_quotient},
+                "回答(余)": {"number": q.user_remainder},
+            })
+        else: # 掛け算
+            properties.update({
+                '正答': {"number": q.correct_answer},
+                '回答': {"number": q.user_answer},
+            })
+        if session_page_id:
+            properties.update(self.session_relation(session_page_id))
+
+        return {
+            'parent': {'database_id': database_id},
+            'properties': properties
+        }
+
+    def build_session_data(self, session_key, questions=None, question_type=None):
+        """バッファに保存するセッションデータ (列形式、Notionのペイロードはアップロード時に作成)
+
+        questions省略時は実行中のセッション (サーバーモードでは学習者ごとの問題記録を渡す)
+        """
+        return {
+            'format': BUFFER_FORMAT,
+            'question_type': question_type or self.settings.question_type,
+            'upload_mode': self.settings.upload_mode,
+            'debug': self.settings.debug,
+            'columns': to_columns(self.questions if questions is None else questions)
+        }
+
+    def session_payloads(self, session_key, session_data):
+        """バッファのセッションから (メインページ, 問題ページ作成関数, 問題数) を返す"""
+        if 'columns' not in session_data:
+            # 旧形式: ペイロードをそのまま保存している
+            pages = session_data['questions']
+
+            def legacy_page(idx, database_id='PLACEHOLDER', session_page_id=None):
+                page = {**pages[idx], 'parent': {'database_id': database_id}}
+                if session_page_id:
+                    page['properties'] = {**page['properties'], **self.session_relation(session_page_id)}
+                return page
+            return session_data['main_page'], legacy_page, len(pages)
+
+        question_type = session_data['question_type']
+        records = from_columns(question_type, session_data['columns'])
+        main_page = self.build_main_page(session_key, SessionStats.from_questions(records), question_type,
+                                         session_data.get('debug', False))
+
+        def question_page(idx, database_id='PLACEHOLDER', session_page_id=None):
+            return self.build_question_page(idx, records[idx], database_id, session_page_id)
+        return main_page, question_page, len(records)
 
-            if q['type'] == "割り算":
-                properties.update({
-                    "正答(商)": {"number": q['correct_quotient']},
-                    "正答(余)": {"number": q['correct_remainder']},
-                    "回答(商)": {"number": q['user_quotient']},
-                    "回答(余)": {"number": q['user_remainder']},
-                })
-            else: # 掛け算
-                properties.update({
-                    '正答': {"number": q['correct_answer']},
-                    '回答': {"number": q['user_answer']},
-                })
-
-            question_data = {
-                'parent': {'database_id': 'PLACEHOLDER'},
-                'properties': properties
+    @staticmethod
+    def property_text(prop):
+        """プロパティ値を表セル用の文字列に変換"""
+        if 'title' in prop:
+            return ''.join(t['text']['content'] for t in prop['title'])
+        if 'rich_text' in prop:
+            return ''.join(t['text']['content'] for t in prop['rich_text'])
+        if 'select' in prop:
+            return prop['select']['name']
+        if 'number' in prop:
+            return '' if prop['number'] is None else str(prop['number'])
+        return ''
+
+    def build_table_block(self, question_pages):
+        """個別問題を1つの表ブロックに変換 (列はbuild_question_pageと同じ)"""
+        columns = list(question_pages[0]['properties'].keys())
+
+        def row(cells):
+            return {
+                'type': 'table_row',
+                'table_row': {'cells': [[{'type': 'text', 'text': {'content': c}}] for c in cells]}
             }
-            questions.append(question_data)
-        
+
+        rows = [row(columns)]
+        rows += [row([self.property_text(q['properties'][c]) for c in columns]) for q in question_pages]
         return {
-            'main_page': main_page, 
-            'questions': questions,
-            'question_type': QUESTION_TYPE
+            'object': 'block',
+            'type': 'table',
+            'table': {
+                'table_width': len(columns),
+                'has_column_header': True,
+                'has_row_header': False,
+                'children': rows
+            }
         }
 
-    def upload_session(self, session_data):
-        """単一セッションをNotionにアップロード"""
-        # メインページ作成
-        main_page_result = self.notion_request(URL_PAGES, session_data['main_page'])
-        if not main_page_result:
+    def ensure_session_schema(self):
+        """統計列がセッションのデータベースになければ追加 (プロセスごとに1回)"""
+        with self._notion_lock:
+            if self.schema_ready:
+                return True
+        properties = {name: {"number": {"format": "number"}} for name in STATS_PROPERTY_NAMES}
+        with self.tracer.span('schema') as span:
+            result = self.notion_request(f"{self.url_database}/{self.settings.database_id}",
+                                         {'properties': properties}, method='PATCH')
+            span['ok'] = bool(result)
+        with self._notion_lock:
+            self.schema_ready = bool(result)
+            return self.schema_ready
+
+    def upload_session(self, session_key, session_data, executor=None):
+        """単一セッションをNotionにアップロード (前回の途中経過から再開)"""
+        progress = session_data.get('progress', {})
+        if not self.ensure_session_schema():
             return False
+        main_page, question_page, count = self.session_payloads(session_key, session_data)
+
+        # メインページ作成
+        main_page_id = progress.get('main_page_id')
+        if not main_page_id:
+            with self.tracer.span('main_page', session=session_key) as span:
+                main_page_result = self.notion_request(self.url_pages, main_page)
+                span['ok'] = bool(main_page_result)
+            if not main_page_result:
+                return False
+            main_page_id = main_page_result['id']
+            self.buffer.checkpoint(session_key, main_page_id=main_page_id)
+        elif progress.get('main_page_provisional'):
+            # バックグラウンド送信で先に作成したページの統計を確定させる
+            page_url = f"{self.url_pages}/{main_page_id}"
+            with self.tracer.span('main_page_update', session=session_key) as span:
+                span['ok'] = bool(self.notion_request(
+                    page_url, {'properties': main_page['properties']}, method='PATCH'))
+            if not span['ok']:
+                return False
+            self.buffer.checkpoint(session_key, main_page_provisional=False)
+
+        if session_data.get('upload_mode') == 'table':
+            return self._upload_tables(session_key, progress, question_page, count, main_page_id)
         
-        # データベース作成
-        database_id = self.create_database(main_page_result['id'], session_data['question_type'])
+        # データベース作成 (共有モードでは問題種ごとのデータベースを使い、セッションページとリレーションで結ぶ)
+        shared = session_data.get('upload_mode') == 'shared'
+        database_id = progress.get('database_id')
         if not database_id:
-            return False
-        
-        # 個別問題をアップロード
-        for question_data in session_data['questions']:
-            question_data['parent']['database_id'] = database_id
-            if not self.notion_request(URL_PAGES, question_data):
+            question_type = session_data.get('question_type', self.settings.question_type)
+            if shared:
+                database_id = self.shared_database(question_type)
+            else:
+                database_id = self.create_database(main_page_id, question_type)
+            if not database_id:
                 return False
+            self.buffer.checkpoint(session_key, database_id=database_id)
+        session_page_id = main_page_id if shared else None
         
+        # 未送信の個別問題のみ並列アップロード (レートはNotionClientで制御)
+        done = set(progress.get('done', []))
+        pending = [(idx, question_page, database_id, session_page_id) for idx in range(count) if idx not in done]
+        if done:
+            print(f"再開: {session_key} (送信済み {len(done)}問 / 残り {len(pending)}問)")
+
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.settings.upload_workers) as own_executor:
+                return self._upload_questions(own_executor, session_key, pending)
+        return self._upload_questions(executor, session_key, pending)
+
+    def _upload_tables(self, session_key, progress, question_page, count, main_page_id):
+        """個別問題を表ブロックとしてメインページに追記 (1リクエストあたり最大99問)"""
+        done = set(progress.get('done', []))
+        pending = [idx for idx in range(count) if idx not in done]
+        chunk_size = TABLE_ROWS_PER_BLOCK - 1
+        url = f"{self.url_blocks}/{main_page_id}/children"
+
+        # 表の順序を保つため順番に送信
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            block = self.build_table_block([question_page(idx) for idx in chunk])
+            with self.tracer.span('table_block', session=session_key, rows=len(chunk)) as span:
+                span['ok'] = bool(self.notion_request(url, {'children': [block]}, method='PATCH'))
+            if not span['ok']:
+                return False
+            self.buffer.checkpoint(session_key, done=chunk)
+        return True
+
+    def _upload_question(self, session_key, idx, question_page, database_id, session_page_id):
+        """問題ページを1件作成・送信し、成功したら送信済みとして記録"""
+        with self.tracer.span('question_page', session=session_key, idx=idx) as span:
+            page = question_page(idx, database_id, session_page_id)
+            span['ok'] = bool(self.notion_request(self.url_pages, page))
+        if not span['ok']:
+            return False
+        self.buffer.checkpoint(session_key, done=[idx])
         return True
 
+    def _upload_questions(self, executor, session_key, pending):
+        """問題ページを並列送信し、1件でも失敗したら残りを取り消す"""
+        futures = [executor.submit(self._upload_question, session_key, *args) for args in pending]
+        success = True
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            if not future.result():
+                success = False
+                for pending_future in futures:
+                    pending_future.cancel()
+        return success
+
     def process_buffer(self):
-        """バッファ処理"""
+        """バッファ処理 (他のプロセスがアップロード中ならNoneを返して任せる)"""
+        if not self.buffer.upload_lock.acquire(blocking=False):
+            print("別のプロセスがアップロード中です")
+            return None
+        try:
+            return self._process_buffer()
+        finally:
+            self.buffer.upload_lock.release()
+
+    def _process_buffer(self):
         buffer_data = self.file_operation('load')
         if not buffer_data:
             print("バッファは空です")
@@ -285,126 +799,168 @@ class QuizApp:
         uploaded_keys = []
         failed_keys = []
 
-        for session_key in sessions_to_process:
-            session_data = buffer_data[session_key]
-            print(f"アップロード中: {session_key}")
-            if self.upload_session(session_data):
-                uploaded_keys.append(session_key)
-                print(f"✓ 成功: {session_key}")
-            else:
-                failed_keys.append(session_key)
-                print(f"✗ 失敗: {session_key}")
-        
-        # 成功したセッションをバッファから削除
-        current_buffer = self.file_operation('load')
-        for key in uploaded_keys:
-            if key in current_buffer:
-                del current_buffer[key]
+        # セッション単位と問題単位で別々のプールを使う (入れ子の待ち合わせによるデッドロック回避)
+        with ThreadPoolExecutor(max_workers=self.settings.upload_workers) as session_executor, \
+                ThreadPoolExecutor(max_workers=self.settings.upload_workers) as question_executor:
+            futures = {}
+            for session_key in sessions_to_process:
+                print(f"アップロード中: {session_key}")
+                future = session_executor.submit(
+                    self.upload_session, session_key, buffer_data[session_key], question_executor)
+                futures[future] = session_key
+
+            for future in as_completed(futures):
+                session_key = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    print(f"アップロードエラー ({session_key}): {e}")
+                    success = False
+                if success:
+                    uploaded_keys.append(session_key)
+                    print(f"✓ 成功: {session_key}")
+                else:
+                    failed_keys.append(session_key)
+                    print(f"✗ 失敗: {session_key}")
         
-        # バッファ更新
-        if current_buffer:
-            self.file_operation('save', current_buffer)
-        else:
-            self.file_operation('delete')
+        # 成功したセッションをバッファから削除 (削除レコードの追記のみ)
+        self.file_operation('remove', uploaded_keys)
+        if not self.file_operation('load'):
             print("バッファファイルを削除しました")
         
         total_sessions = len(sessions_to_process)
         if total_sessions > 0:
             success_rate = len(uploaded_keys) / total_sessions
             print(f"アップロード結果: {len(uploaded_keys)}/{total_sessions} セッション ({success_rate:.1%})")
+            print(self.notion.summary())
         
         return not failed_keys
 
-    def generate_problems(self, count=NUM_QUESTIONS):
+    def sync_forever(self):
+        """常駐してバッファを定期的にアップロード (--sync、失敗が続くと間隔を倍々に延ばす)"""
+        if not self.buffer.sync_lock.acquire(blocking=False):
+            print("同期プロセスは既に起動しています")
+            return
+        interval = self.settings.sync_interval
+        print(f"=== 同期プロセス開始 ({interval:.0f}秒ごと) ===")
+        try:
+            while True:
+                attempted, success = False, None
+                if self.file_operation('load'):
+                    with self.tracer.span('sync'):
+                        attempted, success = True, self.process_buffer()
+                if self.settings.pull_sync:
+                    attempted = True
+                    if self.pull_history() is None:
+                        success = False
+                if success is False:
+                    interval = min(interval * 2, self.settings.sync_max_interval)
+                    print(f"{interval:.0f}秒後に再試行します")
+                elif attempted:
+                    interval = self.settings.sync_interval
+                self.tracer.write_metrics()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("同期プロセスを終了します")
+        finally:
+            self.buffer.sync_lock.release()
+
+    def load_sampler(self):
+        """苦手分析の重みを読み込む (初回は履歴から作成し、以降は前回以降に履歴に加わった分を反映)"""
+        from sampler import WeakSpotSampler
+
+        settings = self.settings
+        if not WeakSpotSampler.supported(settings.num_digits):
+            print(f"桁数 {settings.num_digits} では組み合わせが多すぎるため一様に出題します")
+            return None
+        sampler = WeakSpotSampler(settings.num_digits, settings.weights_path)
+        loaded = sampler.load()
+        if os.path.exists(settings.history_path):
+            from history import HistoryStore
+
+            history = HistoryStore(settings.history_path)
+            try:
+                # 集計より先に読む (集計中に取り込まれたセッションは次回また確認する)
+                last_rowid = history.last_session_rowid()
+                if not loaded:
+                    sampler.load_history(history.operand_summary(settings.question_type))
+                elif last_rowid > sampler.history_rowid:
+                    # 他の端末から取り込んだセッションに含まれる組み合わせだけ集計し直す
+                    sampler.load_history(history.operand_summary(settings.question_type,
+                                                                 after_rowid=sampler.history_rowid))
+                sampler.history_rowid = last_rowid
+            finally:
+                history.close()
+        return sampler
+
+    def answer(self, prompt):
+        """キーパッドから回答を受け取る (QuizEngineの回答元)"""
+        first = self.keypad.first_rendered is None
+        result = self.keypad.ask(prompt.title, prompt.question, show_r_button=prompt.show_r_button)
+        number = len(self.questions) + 1
+        self.tracer.add('render', self.keypad.render_time, question=number)
+        self.tracer.add('answer', result[1], question=number)
+        if first and self.keypad.first_rendered is not None:
+            self.record_startup_time(self.keypad.first_rendered - STARTUP_TIME)
+        return result
+
+    def record_startup_time(self, elapsed):
+        """起動から最初の問題表示までの時間を記録 (退行の確認用)"""
+        print(f"起動時間: {elapsed * 1000:.0f}ms")
+        record = {'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'startup_ms': round(elapsed * 1000, 1)}
+        try:
+            os.makedirs(self.settings.config_dir, exist_ok=True)
+            with open(os.path.join(self.settings.config_dir, 'startup_times.jsonl'), 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+        except OSError as e:
+            print(f"起動時間の記録に失敗しました: {e}")
+
+    def generate_problems(self, count=None, source=None):
         """問題生成・実行"""
-        self.questions = []
-        i = 0
-        
-        while i < count:
-            # 問題生成
-            X = int(''.join([str(random.randint(1, 9)) for _ in range(NUM_DIGITS)]))
-            Y = int(''.join([str(random.randint(1, 9)) for _ in range(NUM_DIGITS)]))
-            R = random.randint(1, X - 1)
-            Z = X * Y + R
-            start_time = time.time()
-            
-            if DEBUG:
-                print(f"デバッグ: Z={Z},X={X}, Y={Y}, R={R}, 残り={count-i}, タイプ={QUESTION_TYPE}")
+        settings = self.settings
+        if count is None:
+            count = settings.num_questions
+        if settings.stream_upload and not self.headless:
+            self.streamer = StreamingUploader(self, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
-            is_correct = False
-            question_data = {'type': QUESTION_TYPE}
-            display_correct_answer = ""
+        if settings.adaptive_sampling and self.sampler is None:
+            self.sampler = self.load_sampler()
 
-            if QUESTION_TYPE == "掛け算":
-                question = f"残り問題数：{count-i}問題: {X} × {Y}+{R} = ?"
-                user_answer_str = self.custom_keypad_dialog("掛け算問題", question)
-                user_answer = self.safe_int(user_answer_str)
-                
-                is_correct = (Z == user_answer)
-                
-                question_data.update({
-                    'question': f'{X} × {Y}',
-                    'correct_answer': Z,
-                    'user_answer': user_answer,
-                })
-                display_correct_answer = Z
-
-            elif QUESTION_TYPE == "割り算":
-                
-                question = f"残り問題数：{count-i}問題: {Z} ÷ {X} = ? 余り ?"
-                user_input_str = self.custom_keypad_dialog("割り算問題", question, show_r_button=True)
-                
-                user_quotient, user_remainder = 0, 0
-                if user_input_str:
-                    if '余り' in user_input_str:
-                        parts = user_input_str.split('余り', 1)
-                        user_quotient = self.safe_int(parts[0])
-                        user_remainder = self.safe_int(parts[1]) if len(parts) > 1 and parts[1] else 0
-                    else:
-                        user_quotient = self.safe_int(user_input_str)
-
-                is_correct = (Y == user_quotient and R == user_remainder)
-
-                question_data.update({
-                    'question': f'{Z} ÷ {X}',
-                    'correct_quotient': Y,
-                    'correct_remainder': R,
-                    'user_quotient': user_quotient,
-                    'user_remainder': user_remainder,
-                })
-                display_correct_answer = f"{Y} 余り {R}"
-
-            elapsed_time = time.time() - start_time
-            judge = "正解" if is_correct else "誤解"
-            result_msg = f"{judge} {elapsed_time:.2f}秒"
-            
-            if not is_correct:
-                result_msg += f"\n正解: {display_correct_answer}"
-                if ADD_QUESTIONS_ON_MISTAKE > 0:
-                    count += ADD_QUESTIONS_ON_MISTAKE
-                    result_msg += f"\n({ADD_QUESTIONS_ON_MISTAKE}問追加されました)"
+        with self.tracer.span('generation', count=count):
+            engine = QuizEngine(settings.question_type, settings.num_digits, count,
+                                settings.add_questions_on_mistake, settings.max_questions,
+                                seed=settings.seed, unique=settings.unique_problems, debug=settings.debug,
+                                sampler=self.sampler)
+        self.questions = engine.questions
+        self.stats = engine.stats
 
-            messagebox.showinfo("結果", result_msg)
-            
-            question_data['time'] = elapsed_time
-            question_data['judge'] = judge
-            self.questions.append(question_data)
-            
-            if is_correct:
-                i += 1
+        def on_result(question_data, result_msg):
+            if not self.headless:
+                self.keypad.set_stats(self.stats.summary_text())
+                # 常に手前に表示されるキーパッドの後ろに隠れないよう親を指定
+                messagebox.showinfo("結果", result_msg, parent=self.keypad.window)
+            if self.streamer:
+                self.streamer.submit(len(self.questions) - 1, question_data)
+
+        with self.tracer.span('quiz') as span:
+            engine.run(source or self, on_result)
+            span['questions'] = len(self.questions)
+        if self.keypad:
+            self.keypad.close()
         
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     def run(self):
         """メイン実行"""
         print("=== 計算問題アプリ開始 ===")
-        if DEBUG:
+        if self.settings.debug:
             print("デバッグモード: 有効")
-            print(config)
+            print(self.settings)
 
         
         # 1. 問題実行
         session_key = self.generate_problems()
+        progress = self.streamer.finish(self.settings.stream_drain_seconds) if self.streamer else {}
         if not self.questions: # 問題が生成されなかった場合
             print("問題がキャンセルされたか、生成されませんでした")
             self.root.destroy()
@@ -412,39 +968,115 @@ class QuizApp:
         
         # 2. バッファ保存
         print("\n=== バッファ保存 ===")
-        session_data = self.build_session_data(session_key)
-        buffer_data = self.file_operation('load')
-        buffer_data[session_key] = session_data
+        with self.tracer.span('build_session', questions=len(self.questions)):
+            session_data = self.build_session_data(session_key)
+        if progress:
+            # バックグラウンド送信済みの分は再送しない
+            session_data['progress'] = progress
         
-        if not self.file_operation('save', buffer_data):
+        if not self.file_operation('append', {session_key: session_data}):
             messagebox.showerror("エラー", "バッファ保存に失敗しました")
             self.root.destroy()
             return
         
         print(f"バッファに保存: {session_key}")
+        self.record_history(session_key)
+        if self.sampler:
+            try:
+                self.sampler.save()
+            except OSError as e:
+                print(f"重みの保存に失敗しました: {e}")
         
-        # 3. バッファ処理
-        print("\n=== Notionアップロード ===")
-        upload_success = self.process_buffer()
+        # 3. バッファ処理 (同期プロセスが起動中なら任せてすぐ終了)
+        if self.buffer.sync_running():
+            print("同期プロセスが起動中のため、アップロードはそちらで行います")
+            upload_success = None
+        else:
+            # 他の端末の結果の取り込みはアップロードと並行して行う
+            puller = None
+            if self.settings.pull_sync:
+                puller = threading.Thread(target=self.pull_history, daemon=True)
+                puller.start()
+            print("\n=== Notionアップロード ===")
+            with self.tracer.span('upload'):
+                upload_success = self.process_buffer()
+            if puller:
+                puller.join()
         
         # 4. 結果表示
         avg_time, correct_rate, _ = self.calculate_stats()
+        history_stats = self.history_stats()
         
         message = f"日付: {session_key}\n平均時間: {avg_time:.2f}秒\n正答率: {correct_rate:.1%}"
+        if history_stats and history_stats['count']:
+            message += (f"\n\n過去{self.settings.history_days}日 ({history_stats['count']}問)\n"
+                        f"平均時間: {history_stats['avg_time']:.2f}秒 (中央値 {history_stats['p50']:.2f}秒)\n"
+                        f"正答率: {history_stats['accuracy']:.1%}")
         
-        if upload_success:
-            messagebox.showinfo("完了", f"全ての処理が完了しました\n{message}")
+        message += "\n\n成績の推移を表示しますか?"
+        if upload_success is None:
+            show_chart = messagebox.askyesno("完了", f"バッファに保存しました\n"
+                                                   f"アップロードは同期プロセスまたは次回実行時に行われます\n\n{message}",
+                                             icon='info')
+        elif upload_success:
+            show_chart = messagebox.askyesno("完了", f"全ての処理が完了しました\n{message}", icon='info')
         else:
-            messagebox.showwarning("部分完了", 
-                                 f"データはバッファに保存されました\n"
-                                 f"一部のNotionアップロードが失敗しました\n"
-                                 f"次回実行時に再試行されます\n\n{message}")
+            show_chart = messagebox.askyesno("部分完了",
+                                             f"データはバッファに保存されました\n"
+                                             f"一部のNotionアップロードが失敗しました\n"
+                                             f"次回実行時に再試行されます\n\n{message}", icon='warning')
+        if show_chart:
+            self.show_history_chart()
         
         self.root.destroy()
 
+    def show_history_chart(self):
+        """成績の推移グラフを開き、閉じるまで待つ"""
+        from history_chart import HistoryChart
+
+        try:
+            chart = HistoryChart(self.root, self.settings)
+        except Exception as e:
+            messagebox.showerror("エラー", f"成績の推移を表示できません: {e}")
+            return
+        self.root.wait_window(chart)
+
+def profile_run(app):
+    """run() 全体をcProfileで計測し、結果を保存して上位を表示"""
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(app.run)
+    finally:
+        path = os.path.join(app.settings.config_dir, f"profile_{datetime.now():%Y%m%d-%H%M%S}.prof")
+        profiler.dump_stats(path)
+        print(f"プロファイルを保存しました: {path}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
 def main():
-    app = QuizApp()
-    app.run()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='計算問題アプリ')
+    parser.add_argument('--sync', action='store_true',
+                        help='ウィンドウを開かずに常駐し、バッファを定期的にNotionへ送信する')
+    parser.add_argument('--pull', action='store_true',
+                        help='ウィンドウを開かずに、Notionの結果をローカル履歴に取り込んで終了する')
+    args = parser.parse_args()
+
+    app = QuizApp(headless=args.sync or args.pull)
+    try:
+        if args.sync:
+            app.sync_forever()
+        elif args.pull:
+            app.pull_history()
+        elif app.settings.profile:
+            profile_run(app)
+        else:
+            app.run()
+    finally:
+        app.tracer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# リポジトリ直下のモジュールを読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Question import QuizApp
+from problem_generator import ProblemGenerator
+from quiz_engine import QuizEngine, RandomAnswers
+from settings import Settings
+from stub_notion import StubNotionServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def timeit(func, repeat=5):
+    """repeat回実行して最小値 (秒) を返す"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_app(workdir, buffer_file=None, **overrides):
+    """config.json を使わず、作業ディレクトリ内で完結するアプリを作成"""
+    settings = Settings(config_dir=workdir, stream_upload=False, **overrides)
+    return QuizApp(headless=True, buffer_file=buffer_file, settings=settings)
+
+
+def make_questions(count, question_type='掛け算', seed=0):
+    engine = QuizEngine(question_type, 3, count, add_on_mistake=0, max_questions=count, seed=seed)
+    return engine.run(RandomAnswers(0.1, seed=seed))
+
+
+def bench_generation(results, quick):
+    for num_digits in (1, 3, 10, 100):
+        for count in (100, 1000):
+            generator = ProblemGenerator(num_digits, seed=0)
+            seconds = timeit(lambda: generator.generate(count), 3 if quick else 5)
+            results.append({'name': 'generate', 'params': {'num_digits': num_digits, 'count': count},
+                            'seconds': seconds, 'per_item_us': seconds / count * 1e6})
+
+
+def bench_build_session_data(results, workdir, quick):
+    app = make_app(workdir)
+    for question_type in ('掛け算', '割り算'):
+        for count in (10, 100, 1000):
+            app.questions = make_questions(count, question_type)
+            seconds = timeit(lambda: app.build_session_data('2024-01-01 00:00:00'), 3 if quick else 5)
+            results.append({'name': 'build_session_data', 'params': {'type': question_type, 'questions': count},
+                            'seconds': seconds})
+
+
+def bench_buffer(results, workdir, quick):
+    app = make_app(workdir)
+    app.questions = make_questions(10)
+    session_data = app.build_session_data('template')
+    backlogs = (1, 100, 1000) if quick else (1, 100, 1000, 10000)
+
+    for backlog in backlogs:
+        path = os.path.join(workdir, f'buffer_{backlog}.jsonl')
+        app = make_app(workdir, path)
+        app.file_operation('append', {f'session {i:06d}': session_data for i in range(backlog)})
+
+        # 新しいプロセスでの初回読み込み (ログ全体の再生)
+        def load():
+            make_app(workdir, path).file_operation('load')
+
+        load_seconds = timeit(load, 3)
+        save_seconds = timeit(lambda: app.file_operation('append', {'extra': session_data}), 3)
+        remove_seconds = timeit(lambda: app.file_operation('remove', ['extra']), 1)
+        results.append({'name': 'buffer', 'params': {'backlog': backlog},
+                        'load_seconds': load_seconds, 'save_seconds': save_seconds,
+                        'remove_seconds': remove_seconds, 'file_bytes': os.path.getsize(path)})
+
+
+def bench_process_buffer(results, workdir, quick, scenarios):
+    for scenario in scenarios:
+        server = StubNotionServer(latency=scenario['latency'], rate_429=scenario['rate_429'],
+                                  fail_rate=scenario['fail_rate'], seed=0).start()
+        try:
+            app = make_app(workdir, os.path.join(workdir, f"upload_{scenario['name']}.jsonl"),
+                           notion_api_url=server.url, notion_rate_limit=scenario['rate_limit'],
+                           upload_mode=scenario['mode'], notion_max_retries=3)
+            sessions = {}
+            for i in range(scenario['sessions']):
+                app.questions = make_questions(scenario['questions'], seed=i)
+                sessions[f'session {i:04d}'] = app.build_session_data(f'session {i:04d}')
+            app.file_operation('append', sessions)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                success = app.process_buffer()
+            seconds = time.perf_counter() - start
+            notion = app.notion
+            results.append({
+                'name': 'process_buffer', 'params': scenario, 'seconds': seconds, 'success': success,
+                'remaining_sessions': len(app.file_operation('load')),
+                'requests': notion.call_count, 'retries': notion.retry_count,
+                'requests_per_sec': notion.call_count / seconds, 'status': dict(server.counts),
+            })
+        finally:
+            server.stop()
+
+
+def compare(current, baseline_path):
+    """前回の結果との比較を表示 (秒数の比)"""
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+
+    def key(r):
+        return r['name'] + ' ' + json.dumps(r['params'], ensure_ascii=False, sort_keys=True)
+
+    old = {key(r): r for r in baseline['results']}
+    for r in current['results']:
+        before = old.get(key(r))
+        if not before:
+            continue
+        for field in ('seconds', 'load_seconds', 'save_seconds'):
+            if field in r and before.get(field):
+                print(f"{key(r)} {field}: {before[field]:.6f} -> {r[field]:.6f} ({r[field] / before[field]:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成・セッション構築・バッファ・アップロードのベンチマーク')
+    parser.add_argument('--quick', action='store_true', help='規模を縮小して短時間で実行')
+    parser.add_argument('--only', choices=['generate', 'build', 'buffer', 'upload'], action='append',
+                        help='実行する項目 (複数指定可、省略時は全て)')
+    parser.add_argument('--output', default=None, help='結果のJSONファイル (省略時は results/ に日時付きで保存)')
+    parser.add_argument('--compare', default=None, help='比較対象の結果JSONファイル')
+    args = parser.parse_args()
+    only = set(args.only or ['generate', 'build', 'buffer', 'upload'])
+
+    scenarios = [
+        {'name': 'database', 'mode': 'database', 'sessions': 3, 'questions': 20,
+         'latency': 0.05, 'rate_429': 0.0, 'fail_rate': 0.0, 'rate_limit': 30},
+        {'name': 'database_throttled', 'mode': 'database', 'sessions': 3, 'questions': 20,
+         'latency': 0.05, 'rate_429': 0.05, 'fail_rate': 0.02, 'rate_limit': 30},
+        {'name': 'table', 'mode': 'table', 'sessions': 3, 'questions': 200,
+         'latency': 0.05, 'rate_429': 0.0, 'fail_rate': 0.0, 'rate_limit': 30},
+    ]
+    if args.quick:
+        scenarios = scenarios[:1]
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='quiz_bench_')
+    try:
+        if 'generate' in only:
+            bench_generation(results, args.quick)
+        if 'build' in only:
+            bench_build_session_data(results, workdir, args.quick)
+        if 'buffer' in only:
+            bench_buffer(results, workdir, args.quick)
+        if 'upload' in only:
+            bench_process_buffer(results, workdir, args.quick, scenarios)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+
+    for r in results:
+        print(json.dumps(r, ensure_ascii=False))
+    print(f"結果を保存しました: {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubNotionServer(ThreadingHTTPServer):
+    """api.notion.com の代わりに応答するローカルサーバ (遅延・429・500を確率で発生)"""
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, rate_429=0.0, fail_rate=0.0, retry_after=0.1, seed=None):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter()  # (メソッド, 種別, ステータス) ごとのリクエスト数
+        self.databases = {}  # 作成されたデータベース (検索用)
+        self.pages = {}  # 作成されたページ (データベースのクエリ用)
+        self.children = {}  # ブロックID -> 子ブロックのリスト
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def choose_status(self):
+        with self.lock:
+            r = self.rng.random()
+        if r < self.rate_429:
+            return 429
+        if r < self.rate_429 + self.fail_rate:
+            return 500
+        return 200
+
+    def record(self, method, path, status):
+        kind = path.split('/')[2] if path.count('/') >= 2 else path
+        with self.lock:
+            self.counts[f"{method} {kind} {status}"] += 1
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _with_plain_text(properties):
+    """作成時の形式のプロパティを取得時の形式 (plain_text付き) に変換"""
+    result = {}
+    for name, prop in properties.items():
+        prop = dict(prop)
+        for kind in ('title', 'rich_text'):
+            if kind in prop:
+                prop[kind] = [dict(t, plain_text=t['text']['content']) for t in prop[kind]]
+        result[name] = prop
+    return result
+
+
+def _paginate(items, start_cursor, page_size):
+    start = int(start_cursor or 0)
+    end = start + int(page_size or 100)
+    return {'object': 'list', 'results': items[start:end], 'has_more': end < len(items),
+            'next_cursor': str(end) if end < len(items) else None}
+
+
+def _matches(page, condition):
+    """クエリのフィルタ (last_edited_timeとリレーションのみ対応)"""
+    if not condition:
+        return True
+    if condition.get('timestamp') == 'last_edited_time':
+        return page['last_edited_time'] >= condition['last_edited_time']['on_or_after']
+    relation = page['properties'].get(condition.get('property'), {}).get('relation', [])
+    return condition['relation']['contains'] in [r['id'] for r in relation]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive を有効にして実際のAPIに近づける
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0) if method != 'GET' else 0
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        status = server.choose_status()
+        server.record(method, self.path, status)
+        headers = {}
+        if status == 429:
+            payload = {'object': 'error', 'status': 429, 'code': 'rate_limited'}
+            headers['Retry-After'] = str(server.retry_after)
+        elif status == 500:
+            payload = {'object': 'error', 'status': 500, 'code': 'internal_server_error'}
+        else:
+            payload = self.respond(method, body)
+        self._send(status, payload, headers)
+
+    def respond(self, method, body):
+        """成功時の応答 (アプリが参照するidなどのみ)"""
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        server = self.server
+        if path.endswith('/children'):
+            block_id = path.split('/')[3]
+            if method == 'GET':
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with server.lock:
+                    blocks = list(server.children.get(block_id, []))
+                return _paginate(blocks, query.get('start_cursor'), query.get('page_size'))
+            return {'object': 'list', 'results': [self.add_block(block_id, block)
+                                                 for block in body.get('children', [])]}
+        if path.endswith('/query'):
+            database_id = path.split('/')[3]
+            with server.lock:
+                pages = [p for p in server.pages.values()
+                         if p['parent'].get('database_id') == database_id and _matches(p, body.get('filter'))]
+            if body.get('sorts'):
+                pages.sort(key=lambda p: p['last_edited_time'],
+                           reverse=body['sorts'][0].get('direction') == 'descending')
+            return _paginate(pages, body.get('start_cursor'), body.get('page_size'))
+        if path == '/v1/search':
+            query = body.get('query', '')
+            with self.server.lock:
+                results = [db for db in self.server.databases.values()
+                           if query in ''.join(t['plain_text'] for t in db['title'])]
+            return {'object': 'list', 'results': results, 'has_more': False, 'next_cursor': None}
+        if path.startswith('/v1/databases'):
+            if path.count('/') >= 3:
+                database_id = path.split('/')[3]
+                return {'object': 'database', 'id': database_id,
+                        'parent': {'type': 'page_id', 'page_id': str(uuid.uuid5(uuid.NAMESPACE_URL, database_id))}}
+            database = {
+                'object': 'database', 'id': str(uuid.uuid4()), 'parent': body.get('parent'),
+                'title': [{'plain_text': t['text']['content']} for t in body.get('title', [])],
+                'properties': body.get('properties', {}),
+            }
+            with server.lock:
+                server.databases[database['id']] = database
+                parent_id = (body.get('parent') or {}).get('page_id')
+                if parent_id:
+                    server.children.setdefault(parent_id, []).append(
+                        {'object': 'block', 'id': database['id'], 'type': 'child_database', 'has_children': False})
+            return database
+        if path.count('/') >= 3:
+            page_id = path.split('/')[3]
+            with server.lock:
+                page = server.pages.get(page_id)
+                if page and body.get('properties'):
+                    page['properties'].update(_with_plain_text(body['properties']))
+                    page['last_edited_time'] = _now()
+            return page or {'object': 'page', 'id': page_id}
+        page = {'object': 'page', 'id': str(uuid.uuid4()), 'parent': body.get('parent', {}),
+                'last_edited_time': _now(), 'properties': _with_plain_text(body.get('properties', {}))}
+        with server.lock:
+            server.pages[page['id']] = page
+        return page
+
+    def add_block(self, parent_id, block):
+        """追記されたブロックを保存 (表の行は表ブロックの子として保存)"""
+        block = dict(block, id=str(uuid.uuid4()))
+        rows = block.get(block.get('type'), {}).pop('children', []) if block.get('type') == 'table' else []
+        block['has_children'] = bool(rows)
+        for cells in (row['table_row']['cells'] for row in rows):
+            for cell in cells:
+                for t in cell:
+                    t['plain_text'] = t['text']['content']
+        with self.server.lock:
+            self.server.children.setdefault(parent_id, []).append(block)
+            self.server.children[block['id']] = [dict(row, id=str(uuid.uuid4())) for row in rows]
+            page = self.server.pages.get(parent_id)
+            if page:
+                page['last_edited_time'] = _now()
+        return block
+
+    def _send(self, status, payload, headers):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Notion APIのスタブサーバ')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='応答までの遅延 (秒)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='429を返す確率')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='500を返す確率')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='429のRetry-After (秒)')
+    args = parser.parse_args()
+
+    server = StubNotionServer(args.port, args.latency, args.rate_429, args.fail_rate, args.retry_after)
+    print(f"スタブサーバ起動: {server.url} (NOTION_API_URL に指定)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import copy
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """プロセス間の排他ロック (ロック専用ファイルに対するflock、Windowsではmsvcrt.locking)"""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self, blocking=True):
+        """ロックを取得 (blocking=Falseで取得できなければFalse)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        file = open(self.path, 'a+b')
+        try:
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                while True:
+                    try:
+                        file.seek(0)
+                        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.01)
+        except OSError:
+            file.close()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BufferStore:
+    """追記専用(JSONL)のセッションバッファ
+
+    1行1レコードの操作ログで、put/removeは末尾への追記+fsyncのみ。
+    操作ごとにファイルロックを取り、他のプロセスが追記した分を読み込んでから更新する。
+    置き換え (圧縮・replace) は一時ファイルへの書き出し+renameで行う。
+    """
+    def __init__(self, path, legacy_path=None, compact_bytes=1024 * 1024):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(path + '.lock')
+        self.upload_lock = FileLock(path + '.upload.lock')  # アップロード中のプロセスが保持
+        self.sync_lock = FileLock(path + '.sync.lock')  # 常駐の同期プロセスが保持
+        self.sessions = None  # 読み込み済みの状態 (offsetまでのログを再生したもの)
+        self.offset = 0
+        self.file_id = None  # 置き換えの検出用 (デバイス, inode)
+        self.torn = False  # 末尾が書き込み途中で途切れている
+        self.record_count = 0
+        self.compacting = False
+        if legacy_path:
+            self._migrate(legacy_path)
+
+    def _migrate(self, legacy_path):
+        """旧形式 (JSONファイル全体書き換え) のバッファを取り込む"""
+        with self.file_lock:
+            if not os.path.exists(legacy_path) or os.path.exists(self.path):
+                return
+            with open(legacy_path, 'r', encoding='utf-8') as file:
+                legacy = json.load(file)
+            self._write_snapshot(self.path, legacy)
+            os.replace(legacy_path, legacy_path + '.migrated')
+        print(f"バッファを移行しました: {legacy_path} -> {self.path}")
+
+    def _stat_id(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return (st.st_dev, st.st_ino), st.st_size
+
+    def _refresh(self):
+        """前回以降に (他のプロセスを含め) 追記されたレコードを反映 (ファイルロック中に呼ぶ)"""
+        file_id, size = self._stat_id()
+        if self.sessions is None or file_id != self.file_id or size < self.offset:
+            # 初回、または他のプロセスが圧縮・削除した場合は最初から再生
+            self.sessions, self.offset, self.record_count, self.torn = {}, 0, 0, False
+        self.file_id = file_id
+        if size <= self.offset:
+            return
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read(size - self.offset)
+        self.offset += len(data)
+        lines = data.split(b'\n')
+        # 最後の要素は改行で終わっていれば空、そうでなければ書き込み途中で落ちた行
+        self.torn = bool(lines.pop())
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.record_count += 1
+            if record['op'] == 'put':
+                self.sessions[record['key']] = record['data']
+            elif record['op'] == 'remove':
+                self.sessions.pop(record['key'], None)
+            elif record['op'] == 'progress' and record['key'] in self.sessions:
+                self._merge_progress(self.sessions[record['key']], record['data'])
+
+    def sync_running(self):
+        """常駐の同期プロセスが動いているか"""
+        if not self.sync_lock.acquire(blocking=False):
+            return True
+        self.sync_lock.release()
+        return False
+
+    def load(self):
+        """全セッションを返す (他のプロセスの追記分のみ読み足す)"""
+        with self.lock, self.file_lock:
+            self._refresh()
+            return dict(self.sessions)
+
+    def _append(self, records):
+        data = ''.join(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n' for r in records).encode('utf-8')
+        if self.torn:
+            data = b'\n' + data  # 途切れた行と連結しないよう改行を挟む
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        self.offset += len(data)
+        self.torn = False
+        if self.file_id is None:
+            self.file_id = self._stat_id()[0]
+        self.record_count += len(records)
+
+    def put(self, key, data):
+        """セッションを追加 (追記1行)"""
+        self.put_many({key: data})
+
+    def put_many(self, sessions):
+        """複数セッションをまとめて追加 (fsyncは1回)"""
+        with self.lock, self.file_lock:
+            self._refresh()
+            self._append([{'op': 'put', 'key': k, 'data': d} for k, d in sessions.items()])
+            self.sessions.update(sessions)
+        self._maybe_compact()
+
+    @staticmethod
+    def _merge_progress(session, progress):
+        current = session.setdefault('progress', {})
+        for field, value in progress.items():
+            if field == 'done':
+                current['done'] = sorted(set(current.get('done', [])) | set(value))
+            else:
+                current[field] = value
+
+    def checkpoint(self, key, **progress):
+        """アップロードの途中経過を記録 (main_page_id / database_id / done=[問題番号])"""
+        with self.lock, self.file_lock:
+            self._refresh()
+            if key not in self.sessions:
+                return
+            self._append([{'op': 'progress', 'key': key, 'data': progress}])
+            self._merge_progress(self.sessions[key], progress)
+
+    def remove(self, keys):
+        """アップロード済みセッションを削除 (追記のみ、空になればファイルごと削除)"""
+        with self.lock, self.file_lock:
+            self._refresh()
+            keys = [k for k in keys if k in self.sessions]
+            for key in keys:
+                del self.sessions[key]
+            if not self.sessions:
+                self._clear()
+                return
+            if keys:
+                self._append([{'op': 'remove', 'key': k} for k in keys])
+        self._maybe_compact()
+
+    def replace(self, sessions):
+        """全体を置き換える (圧縮済みスナップショットとして書き出し)"""
+        with self.lock, self.file_lock:
+            self._write_snapshot(self.path, sessions)
+            self.sessions = copy.deepcopy(sessions)
+            self.file_id, self.offset = self._stat_id()
+            self.record_count = len(sessions)
+            self.torn = False
+
+    def clear(self):
+        with self.lock, self.file_lock:
+            self._clear()
+
+    def _clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sessions = {}
+        self.offset = 0
+        self.file_id = None
+        self.record_count = 0
+        self.torn = False
+
+    def _write_snapshot(self, path, sessions):
+        # 同時に圧縮する他のプロセスと一時ファイルが重ならないようPIDを付ける
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            for key, data in sessions.items():
+                record = {'op': 'put', 'key': key, 'data': data}
+                file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def _maybe_compact(self):
+        """ログが閾値を超え、不要レコードが半分以上ならバックグラウンドで圧縮"""
+        with self.lock:
+            if self.compacting or self.record_count < 2 * max(len(self.sessions), 1):
+                return
+            if self.offset < self.compact_bytes:
+                return
+            snapshot = copy.deepcopy(self.sessions)  # 圧縮中もprogressは更新されるため複製
+            snapshot_offset, snapshot_id = self.offset, self.file_id
+            self.compacting = True
+        threading.Thread(target=self._compact, args=(snapshot, snapshot_offset, snapshot_id), daemon=True).start()
+
+    def _compact(self, snapshot, snapshot_offset, snapshot_id):
+        tmp_path = f"{self.path}.{os.getpid()}.compact"
+        try:
+            # スナップショットの書き出しはロック外で行い、追記をブロックしない
+            self._write_snapshot(tmp_path, snapshot)
+            with self.lock, self.file_lock:
+                self._refresh()
+                if self.file_id != snapshot_id:
+                    # 他のプロセスが先に圧縮・削除した
+                    os.remove(tmp_path)
+                    return
+                # 書き出し中に (他のプロセスを含め) 追記されたレコードを引き継ぐ
+                with open(self.path, 'rb') as file:
+                    file.seek(snapshot_offset)
+                    tail = file.read(self.offset - snapshot_offset)
+                tail = tail[:tail.rfind(b'\n') + 1]
+                with open(tmp_path, 'ab') as file:
+                    file.write(tail)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.path)
+                self.file_id, self.offset = self._stat_id()
+                self.record_count = len(snapshot) + tail.count(b'\n')
+                self.torn = False
+        except Exception as e:
+            print(f"バッファ圧縮エラー: {e}")
+        finally:
+            with self.lock:
+                self.compacting = False
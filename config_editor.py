@@ -4,11 +4,16 @@ from tkinter import messagebox
 import json
 import os
 
+COMBOBOX_VALUES = {
+    "TYPE": ["掛け算", "割り算"],
+    "UPLOAD_MODE": ["database", "shared", "table"],
+}
+
 class ConfigEditor(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("設定エディタ")
-        self.geometry("500x450")
+        self.geometry("500x680")
 
         # スクリプトの場所を基準に設定ファイルのパスを決定
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,7 +28,13 @@ class ConfigEditor(tk.Tk):
             "ADD_QUESTIONS_ON_MISTAKE": tk.IntVar(value=1),
             "NUM_QUESTIONS": tk.IntVar(value=10),
             "MAX_QUESTIONS": tk.IntVar(value=100),
-            "TYPE": tk.StringVar(value="掛け算")
+            "TYPE": tk.StringVar(value="掛け算"),
+            "STREAM_UPLOAD": tk.BooleanVar(value=True),
+            "UPLOAD_MODE": tk.StringVar(value="database"),
+            "ADAPTIVE_SAMPLING": tk.BooleanVar(value=False),
+            "STATS_PROPERTIES": tk.BooleanVar(value=False),
+            "PULL_SYNC": tk.BooleanVar(value=False),
+            "PROFILE": tk.BooleanVar(value=False)
         }
 
         self.create_widgets()
@@ -43,7 +54,13 @@ class ConfigEditor(tk.Tk):
             ("間違い時の追加問題数", "ADD_QUESTIONS_ON_MISTAKE", "spinbox"),
             ("初期問題数", "NUM_QUESTIONS", "spinbox"),
             ("最大問題数", "MAX_QUESTIONS", "spinbox"),
-            ("問題種別", "TYPE", "combobox")
+            ("問題種別", "TYPE", "combobox"),
+            ("回答中に送信", "STREAM_UPLOAD", "checkbutton"),
+            ("アップロード形式", "UPLOAD_MODE", "combobox"),
+            ("苦手な問題を優先", "ADAPTIVE_SAMPLING", "checkbutton"),
+            ("詳細な統計を記録", "STATS_PROPERTIES", "checkbutton"),
+            ("他の端末の結果を取り込む", "PULL_SYNC", "checkbutton"),
+            ("プロファイル (cProfile)", "PROFILE", "checkbutton")
         ]
 
         for i, (label_text, key, widget_type) in enumerate(fields):
@@ -57,13 +74,15 @@ class ConfigEditor(tk.Tk):
             elif widget_type == "spinbox":
                 widget = ttk.Spinbox(frame, from_=1, to=1000, textvariable=self.vars[key])
             elif widget_type == "combobox":
-                widget = ttk.Combobox(frame, textvariable=self.vars[key], values=["掛け算", "割り算"], state="readonly")
+                widget = ttk.Combobox(frame, textvariable=self.vars[key], values=COMBOBOX_VALUES[key], state="readonly")
 
             widget.grid(row=i, column=1, sticky=(tk.W, tk.E), pady=5, padx=5)
 
         # 保存ボタン
-        save_button = ttk.Button(frame, text="保存", command=self.save_config)
-        save_button.grid(row=len(fields), column=0, columnspan=2, pady=20)
+        buttons = ttk.Frame(frame)
+        buttons.grid(row=len(fields), column=0, columnspan=2, pady=20)
+        ttk.Button(buttons, text="保存", command=self.save_config).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="成績の推移", command=self.show_history_chart).pack(side=tk.LEFT, padx=5)
         
         frame.columnconfigure(1, weight=1)
 
@@ -98,6 +117,16 @@ class ConfigEditor(tk.Tk):
         except Exception as e:
             messagebox.showerror("エラー", f"設定ファイルの保存に失敗しました: {e}")
 
+    def show_history_chart(self):
+        """保存済みの設定の履歴から成績の推移グラフを開く"""
+        from history_chart import HistoryChart
+        from settings import get_settings
+
+        try:
+            HistoryChart(self, get_settings(self.config_path), self.vars["TYPE"].get())
+        except Exception as e:
+            messagebox.showerror("エラー", f"成績の推移を表示できません: {e}")
+
 
 if __name__ == "__main__":
     app = ConfigEditor()
@@ -0,0 +1,139 @@
+import argparse
+import csv
+import os
+
+from buffer_store import BufferStore
+from history import HistoryStore, _int
+from records import from_columns
+from settings import get_settings
+
+# 1行 = 1問 (history.pyのquestionsテーブルの列 + 正誤判定・出典)
+COLUMNS = ['session_key', 'idx', 'date', 'question_type', 'x', 'y', 'r', 'z', 'question',
+           'correct_answer', 'user_answer', 'correct_remainder', 'user_remainder',
+           'time', 'correct', 'judge', 'source']
+INTEGER_COLUMNS = COLUMNS[4:8] + COLUMNS[9:13]  # 桁数が大きいと64bitに収まらない列
+INTEGER_INDEXES = [COLUMNS.index(name) for name in INTEGER_COLUMNS]
+CORRECT_INDEX = COLUMNS.index('correct')
+
+
+def _judge(correct):
+    return '正解' if correct else '誤解'
+
+
+def _legacy_rows(session_key, question_type, pages):
+    """旧形式 (Notionのペイロード) のバッファから行を作る (被演算子は保存されていない)"""
+    def number(props, name):
+        return props.get(name, {}).get('number')
+
+    for idx, page in enumerate(pages):
+        props = page['properties']
+        correct = props['正誤判定']['select']['name'] == '正解'
+        if question_type == '割り算':
+            answers = [number(props, '正答(商)'), number(props, '回答(商)'),
+                       number(props, '正答(余)'), number(props, '回答(余)')]
+        else:
+            answers = [number(props, '正答'), number(props, '回答'), None, None]
+        question = ''.join(t['text']['content'] for t in props['問題']['rich_text'])
+        yield (session_key, idx, session_key, question_type, None, None, None, None, question,
+               *map(_int, answers), number(props, '時間'), int(correct), _judge(correct), 'buffer')
+
+
+def buffer_rows(buffer, history=None, question_type=None, since=None, until=None):
+    """未アップロードのセッションの行 (履歴に記録済みのセッションは除く)"""
+    rows = []
+    for session_key, data in sorted(buffer.load().items()):
+        session_type = data.get('question_type', question_type)
+        if (question_type and session_type != question_type) or (since and session_key < since) \
+                or (until and session_key >= until) or (history and history.has_session(session_key)):
+            continue
+        if 'columns' in data:
+            for idx, q in enumerate(from_columns(session_type, data['columns'])):
+                rows.append(HistoryStore.question_row(session_key, idx, q) + (_judge(q.correct), 'buffer'))
+        else:
+            rows.extend(_legacy_rows(session_key, session_type, data['questions']))
+    return rows
+
+
+def iter_chunks(history, pending_rows, chunk_size, question_type=None, since=None, until=None):
+    """履歴 → バッファの順にchunk_size行ずつ返す"""
+    if history:
+        for rows in history.iter_questions(question_type, since, until, chunk_size):
+            yield [row + (_judge(row[14]), 'history') for row in rows]
+    for start in range(0, len(pending_rows), chunk_size):
+        yield pending_rows[start:start + chunk_size]
+
+
+def write_csv(path, chunks):
+    # Excelで文字化けしないようBOM付きUTF-8
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        count = 0
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def write_parquet(path, chunks, big_integers=False):
+    """チャンクごとにrow groupとして書き出す (pyarrowが必要)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquetの書き出しにはpyarrowが必要です (pip install pyarrow)")
+
+    # 64bitに収まらない値が含まれる場合、整数列は文字列として保存
+    integer = pa.string() if big_integers else pa.int64()
+    types = {'idx': pa.int32(), 'time': pa.float64(), 'correct': pa.bool_()}
+    types.update({name: integer for name in INTEGER_COLUMNS})
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in COLUMNS])
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in chunks:
+            columns = [list(values) for values in zip(*rows)]
+            columns[CORRECT_INDEX] = [bool(v) for v in columns[CORRECT_INDEX]]
+            if big_integers:
+                for i in INTEGER_INDEXES:
+                    columns[i] = [None if v is None else str(v) for v in columns[i]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            count += len(rows)
+    return count
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='ローカル履歴と未アップロードのバッファを1問1行で書き出す')
+    parser.add_argument('output', help='出力ファイル (.csv / .parquet)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None, help='省略時は拡張子から判定')
+    parser.add_argument('--type', default=None, help='問題種で絞り込む (掛け算 / 割り算)')
+    parser.add_argument('--since', default=None, help='この日時以降のセッション (例: 2024-01-01)')
+    parser.add_argument('--until', default=None, help='この日時より前のセッション')
+    parser.add_argument('--history', default=settings.history_path, help='ローカル履歴 (SQLite) のパス')
+    parser.add_argument('--buffer', default=settings.buffer_path, help='バッファのパス')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='一度に読み書きする行数')
+    args = parser.parse_args()
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+
+    history = HistoryStore(args.history) if os.path.exists(args.history) else None
+    try:
+        pending = []
+        if os.path.exists(args.buffer):
+            pending = buffer_rows(BufferStore(args.buffer), history, args.type, args.since, args.until)
+        chunks = iter_chunks(history, pending, args.chunk_size, args.type, args.since, args.until)
+        if output_format == 'parquet':
+            big_integers = (history is not None and history.has_big_integers()) or any(
+                isinstance(row[i], str) for row in pending for i in INTEGER_INDEXES)
+            count = write_parquet(args.output, chunks, big_integers)
+        else:
+            count = write_csv(args.output, chunks)
+    finally:
+        if history:
+            history.close()
+    print(f"{count}問を書き出しました: {args.output} (未アップロード {len(pending)}問)")
+
+
+if __name__ == "__main__":
+    main()
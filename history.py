@@ -0,0 +1,207 @@
+import sqlite3
+import threading
+
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key TEXT PRIMARY KEY,
+    question_type TEXT NOT NULL,
+    question_count INTEGER NOT NULL,
+    correct_rate REAL NOT NULL,
+    total_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    session_key TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    x INTEGER, y INTEGER, r INTEGER, z INTEGER,
+    question TEXT NOT NULL,
+    correct_answer INTEGER, user_answer INTEGER,
+    correct_remainder INTEGER, user_remainder INTEGER,
+    time REAL NOT NULL,
+    correct INTEGER NOT NULL,
+    PRIMARY KEY (session_key, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_questions_date ON questions (date);
+CREATE INDEX IF NOT EXISTS idx_questions_type_date ON questions (question_type, date);
+CREATE INDEX IF NOT EXISTS idx_questions_type_time ON questions (question_type, time);
+CREATE INDEX IF NOT EXISTS idx_questions_operands ON questions (question_type, x, y);
+CREATE INDEX IF NOT EXISTS idx_questions_correct ON questions (question_type, correct);
+"""
+
+
+def _int(value):
+    """SQLiteの整数範囲を超える値 (桁数の大きい問題) は文字列で保存"""
+    if value is None or -SQLITE_INT_MAX <= value <= SQLITE_INT_MAX:
+        return value
+    return str(value)
+
+
+class HistoryStore:
+    """全セッション・全問題のローカル履歴 (SQLite)"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')  # WALではコミットごとのfsyncを省略しても破損しない
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def question_row(session_key, idx, q):
+        """問題記録をquestionsテーブルの1行に変換"""
+        X, Y, R, Z = q.operands
+        if q.type == '割り算':
+            answers = (q.correct_quotient, q.user_quotient, q.correct_remainder, q.user_remainder)
+        else:
+            answers = (q.correct_answer, q.user_answer, None, None)
+        return (session_key, idx, session_key, q.type, _int(X), _int(Y), _int(R), _int(Z), q.question,
+                *map(_int, answers), q.time, 1 if q.correct else 0)
+
+    def add_session(self, session_key, question_type, questions):
+        """完了したセッションを記録 (同じキーは上書き)"""
+        self.add_sessions([(session_key, question_type, questions)])
+
+    def add_sessions(self, sessions):
+        """(キー, 問題種, 問題記録のリスト) をまとめて1トランザクションで記録"""
+        session_rows, question_rows = [], []
+        for session_key, question_type, questions in sessions:
+            correct_count = sum(1 for q in questions if q.correct)
+            session_rows.append((session_key, question_type, len(questions),
+                                 correct_count / len(questions) if questions else 0, sum(q.time for q in questions)))
+            question_rows += [self.question_row(session_key, idx, q) for idx, q in enumerate(questions)]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)', session_rows)
+            self.conn.executemany('DELETE FROM questions WHERE session_key = ?', [row[:1] for row in session_rows])
+            self.conn.executemany(f'INSERT INTO questions VALUES ({", ".join("?" * 15)})', question_rows)
+
+    def _where(self, question_type=None, since=None, until=None):
+        clauses, params = [], []
+        if question_type:
+            clauses.append('question_type = ?')
+            params.append(question_type)
+        if since:
+            clauses.append('date >= ?')
+            params.append(since)
+        if until:
+            clauses.append('date < ?')
+            params.append(until)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def stats(self, question_type=None, since=None, until=None, percentiles=(0.5, 0.9, 0.99)):
+        """問題数・正答率・平均時間・時間のパーセンタイル"""
+        where, params = self._where(question_type, since, until)
+        with self.lock:
+            count, accuracy, avg_time = self.conn.execute(
+                f'SELECT COUNT(*), AVG(correct), AVG(time) FROM questions{where}', params).fetchone()
+            result = {'count': count, 'accuracy': accuracy or 0, 'avg_time': avg_time or 0}
+            for p in percentiles:
+                # 時間順のインデックスを使い、該当位置の1行だけ読む
+                row = self.conn.execute(
+                    f'SELECT time FROM questions{where} ORDER BY time LIMIT 1 OFFSET ?',
+                    params + [int(p * (count - 1))]).fetchone() if count else None
+                result[f'p{round(p * 100)}'] = row[0] if row else 0
+        return result
+
+    def daily(self, question_type=None, since=None, until=None):
+        """日別の問題数・正答率・平均時間"""
+        where, params = self._where(question_type, since, until)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT substr(date, 1, 10) AS day, COUNT(*), AVG(correct), AVG(time) '
+                f'FROM questions{where} GROUP BY day ORDER BY day', params).fetchall()
+
+    def by_operands(self, question_type, since=None, limit=20, min_count=1):
+        """組み合わせ別の成績 (正答率の低い順)"""
+        where, params = self._where(question_type, since)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT x, y, COUNT(*) AS n, AVG(correct) AS accuracy, AVG(time) '
+                f'FROM questions{where} GROUP BY x, y HAVING n >= ? '
+                f'ORDER BY accuracy, AVG(time) DESC LIMIT ?', params + [min_count, limit]).fetchall()
+
+    def operand_summary(self, question_type, after_rowid=None):
+        """組み合わせごとの (x, y, 出題数, 正解数, 平均時間)
+
+        after_rowid指定時は、sessionsテーブルのrowidがそれより大きいセッション (以降に記録・取り込み・上書きされたもの)
+        に含まれる組み合わせだけを、全期間の集計で返す
+        """
+        where, params = self._where(question_type)
+        if after_rowid is not None:
+            where += (' AND' if where else ' WHERE') + (
+                ' (x, y) IN (SELECT x, y FROM questions WHERE session_key IN '
+                '(SELECT session_key FROM sessions WHERE rowid > ?))')
+            params.append(after_rowid)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT x, y, COUNT(*), SUM(correct), AVG(time) FROM questions{where} GROUP BY x, y',
+                params).fetchall()
+
+    def last_session_rowid(self):
+        """最後に記録したセッションのrowid (INSERT OR REPLACEで上書きしたセッションも新しいrowidになる)"""
+        with self.lock:
+            return self.conn.execute('SELECT MAX(rowid) FROM sessions').fetchone()[0] or 0
+
+    def session_series(self, question_type=None):
+        """セッションごとの (キー, 問題数, 正答率, 総時間) を時系列順に"""
+        where, params = self._where(question_type)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT session_key, question_count, correct_rate, total_time FROM sessions{where} '
+                f'ORDER BY session_key', params).fetchall()
+
+    def monthly_counts(self, question_type=None):
+        """月ごとの (月, 問題数, 時間の合計) (グラフのキャッシュの検証用、sessionsテーブルのみ読む)"""
+        where, params = self._where(question_type)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT substr(session_key, 1, 7) AS month, SUM(question_count), ROUND(SUM(total_time), 3) '
+                f'FROM sessions{where} GROUP BY month ORDER BY month', params).fetchall()
+
+    def question_times(self, question_type=None, since=None, until=None):
+        """1問ごとの (月, 回答時間) を時系列順に"""
+        where, params = self._where(question_type, since, until)
+        with self.lock:
+            return self.conn.execute(
+                f'SELECT substr(date, 1, 7), time FROM questions{where} ORDER BY session_key, idx', params).fetchall()
+
+    def has_session(self, session_key):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM sessions WHERE session_key = ?', (session_key,)).fetchone() is not None
+
+    def question_count(self, session_key):
+        """記録済みセッションの問題数 (未記録ならNone)"""
+        with self.lock:
+            row = self.conn.execute('SELECT question_count FROM sessions WHERE session_key = ?',
+                                    (session_key,)).fetchone()
+        return row[0] if row else None
+
+    def has_big_integers(self):
+        """整数範囲を超えて文字列で保存した値があるか (最大の値はz・回答のいずれか)"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM questions WHERE typeof(z) = 'text' OR typeof(user_answer) = 'text' "
+                "OR typeof(user_remainder) = 'text' LIMIT 1").fetchone() is not None
+
+    def iter_questions(self, question_type=None, since=None, until=None, chunk_size=10000):
+        """questionsテーブルの行をchunk_size行ずつ返す (全件をメモリに載せない)"""
+        where, params = self._where(question_type, since, until)
+        cursor = self.conn.cursor()
+        with self.lock:
+            # 主キーの順 (セッションキーは日時なのでおおむね時系列) に読むと並べ替えが不要
+            cursor.execute(f'SELECT * FROM questions{where} ORDER BY session_key, idx', params)
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,253 @@
+import bisect
+import json
+import os
+import re
+import time
+import tkinter as tk
+from tkinter import ttk
+
+from history import HistoryStore
+from settings import get_settings
+
+CACHE_VERSION = 1
+MONTH_POINTS = 500  # キャッシュする1か月あたりの点数 (描画時に画面の幅までさらに間引く)
+ALL_TYPES = '全て'
+QUESTION_TYPES = [ALL_TYPES, '掛け算', '割り算']
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 60, 20, 30, 30
+PANEL_GAP = 40
+DATE_KEY = re.compile(r'\d{4}-\d{2}')  # 日時で始まるセッションキー (Notionで手動作成したページなどは除く)
+
+
+def lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets で threshold 点に間引く (xsは昇順、山や谷を残す)"""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    every = (n - 2) / (threshold - 2)
+    out_x, out_y = [xs[0]], [ys[0]]
+    ax, ay = xs[0], ys[0]
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # 次のバケットの平均点
+        cx = sum(xs[end:next_end]) / (next_end - end)
+        cy = sum(ys[end:next_end]) / (next_end - end)
+        # 前に選んだ点・次のバケットの平均点と作る三角形の面積が最大の点を選ぶ
+        dx, dy = ax - cx, cy - ay
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best_area:
+                best, best_area = j, area
+        ax, ay = xs[best], ys[best]
+        out_x.append(ax)
+        out_y.append(ay)
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+def _next_month(month):
+    year, mon = map(int, month.split('-'))
+    return f'{year + mon // 12:04d}-{mon % 12 + 1:02d}'
+
+
+class ChartData:
+    """グラフの系列
+
+    1問ごとの回答時間は月ごとにLTTBで間引いてキャッシュし、sessionsテーブルの問題数・
+    時間の合計が変わった月 (通常は今月のみ) だけ読み直す。セッションごとの値もsessionsテーブルから読む。
+    """
+    def __init__(self, history, cache_path):
+        self.history = history
+        self.cache_path = cache_path
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return cache.get('series', {}) if cache.get('version') == CACHE_VERSION else {}
+
+    def _save_cache(self, series):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': CACHE_VERSION, 'series': series}, file, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"グラフのキャッシュの保存に失敗しました: {e}")
+
+    def question_series(self, question_type):
+        """回答時間の系列 (x: 通し番号)、問題数、p99 (各月の最大)、読み直した月の数"""
+        series = self._load_cache()
+        cached = series.get(question_type or ALL_TYPES, {})
+        counts = [row for row in self.history.monthly_counts(question_type) if DATE_KEY.fullmatch(row[0])]
+        stale = [month for month, count, time_sum in counts
+                 if (cached.get(month) or {}).get('count') != count or cached[month]['time_sum'] != time_sum]
+        months = {month: cached.get(month) for month, _, _ in counts}
+        if stale:
+            # 古くなった月をまとめて1回で読み、月ごとに間引く
+            times = {month: [] for month in stale}
+            for month, value in self.history.question_times(question_type, since=stale[0],
+                                                            until=_next_month(stale[-1])):
+                if month in times:
+                    times[month].append(value)
+            for month, count, time_sum in counts:
+                if month in times:
+                    values = times[month]
+                    xs, ys = lttb(range(len(values)), values, MONTH_POINTS)
+                    p99 = sorted(values)[int(0.99 * (len(values) - 1))] if values else 0
+                    months[month] = {'count': count, 'time_sum': time_sum, 'p99': p99, 'x': list(xs), 'y': ys}
+        if stale or len(months) != len(cached):
+            series[question_type or ALL_TYPES] = months
+            self._save_cache(series)
+
+        xs, ys, offset = [], [], 0
+        for entry in months.values():
+            xs.extend(offset + x for x in entry['x'])
+            ys.extend(entry['y'])
+            offset += entry['count']
+        p99 = max((entry['p99'] for entry in months.values()), default=0)
+        return xs, ys, offset, p99, len(stale)
+
+    def session_series(self, question_type):
+        """セッションごとの (終了時点の通し番号, キー, 平均時間, 正答率)"""
+        xs, keys, mean_times, accuracies, offset = [], [], [], [], 0
+        for session_key, count, accuracy, total_time in self.history.session_series(question_type):
+            if not count or not DATE_KEY.match(session_key):
+                continue
+            offset += count
+            xs.append(offset)
+            keys.append(session_key)
+            mean_times.append(total_time / count)
+            accuracies.append(accuracy)
+        return xs, keys, mean_times, accuracies
+
+
+class HistoryChart(tk.Toplevel):
+    """過去の全セッション・全問題の回答時間と正答率の推移"""
+    def __init__(self, master, settings, question_type=None):
+        super().__init__(master)
+        self.title("成績の推移")
+        self.geometry("900x600")
+        self.settings = settings
+        self.data = None
+        self._redraw_job = None
+
+        top = ttk.Frame(self, padding=5)
+        top.pack(fill=tk.X)
+        ttk.Label(top, text="問題種").pack(side=tk.LEFT)
+        self.type_var = tk.StringVar(self, question_type or settings.question_type)
+        combobox = ttk.Combobox(top, textvariable=self.type_var, values=QUESTION_TYPES, state="readonly", width=8)
+        combobox.pack(side=tk.LEFT, padx=5)
+        combobox.bind('<<ComboboxSelected>>', lambda e: self.load())
+        self.status = ttk.Label(top, foreground='gray30')
+        self.status.pack(side=tk.RIGHT)
+
+        self.canvas = tk.Canvas(self, background='white', highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        # サイズ変更中は描画をまとめる
+        self.canvas.bind('<Configure>', lambda e: self._schedule_redraw())
+        self.load()
+
+    def load(self):
+        """履歴から系列を読み込んで描画"""
+        start = time.perf_counter()
+        question_type = None if self.type_var.get() == ALL_TYPES else self.type_var.get()
+        self.data = None
+        if os.path.exists(self.settings.history_path):
+            history = HistoryStore(self.settings.history_path)
+            try:
+                data = ChartData(history, self.settings.chart_cache_path)
+                times_x, times_y, total, limit, _ = data.question_series(question_type)
+                session_x, keys, mean_times, accuracies = data.session_series(question_type)
+            finally:
+                history.close()
+            if total:
+                self.data = {'times': (times_x, times_y), 'total': total, 'keys': keys, 'session_x': session_x,
+                             'mean_times': mean_times, 'accuracies': accuracies,
+                             'time_limit': max(limit, max(mean_times, default=0)) * 1.1 or 1.0}
+        self.load_ms = (time.perf_counter() - start) * 1000
+        self.redraw()
+
+    def _schedule_redraw(self):
+        if self._redraw_job:
+            self.after_cancel(self._redraw_job)
+        self._redraw_job = self.after(50, self.redraw)
+
+    def redraw(self):
+        self._redraw_job = None
+        start = time.perf_counter()
+        canvas = self.canvas
+        canvas.delete('all')
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if width < 2:  # 表示前
+            width, height = 900, 560
+        if not self.data:
+            canvas.create_text(width / 2, height / 2, text="履歴がありません", fill='gray40', font=('Helvetica', 14))
+            self.status.config(text="")
+            return
+
+        data = self.data
+        plot_width = max(width - MARGIN_LEFT - MARGIN_RIGHT, 10)
+        panel_height = max((height - MARGIN_TOP - MARGIN_BOTTOM - PANEL_GAP) / 2, 10)
+        time_panel = (MARGIN_TOP, panel_height, 0, data['time_limit'])
+        accuracy_panel = (MARGIN_TOP + panel_height + PANEL_GAP, panel_height, 0, 1)
+
+        def x_pixel(x):
+            return MARGIN_LEFT + x / data['total'] * plot_width
+
+        def plot(panel, xs, ys, color, line_width=1):
+            top, panel_height, low, high = panel
+            xs, ys = lttb(xs, ys, int(plot_width))
+            coords = []
+            for x, y in zip(xs, ys):
+                y = min(max(y, low), high)  # 範囲外 (p99を超える時間) は上端に張り付ける
+                coords += (x_pixel(x), top + panel_height * (1 - (y - low) / (high - low)))
+            if len(coords) >= 4:
+                canvas.create_line(*coords, fill=color, width=line_width)
+
+        self._draw_axes(time_panel, plot_width, "回答時間 (秒)  灰: 1問ごと / 青: セッション平均",
+                        lambda v: f"{v:.1f}")
+        self._draw_axes(accuracy_panel, plot_width, "正答率 (セッションごと)", lambda v: f"{v:.0%}")
+        plot(time_panel, *data['times'], 'gray70')
+        plot(time_panel, data['session_x'], data['mean_times'], 'steelblue', 2)
+        plot(accuracy_panel, data['session_x'], data['accuracies'], 'seagreen', 2)
+
+        # x軸はセッションの日付
+        bottom = accuracy_panel[0] + panel_height
+        for i in range(6 if data['keys'] else 0):
+            x = data['total'] * i / 5
+            index = min(bisect.bisect_left(data['session_x'], x), len(data['keys']) - 1)
+            canvas.create_text(x_pixel(x), bottom + 12, text=data['keys'][index][:10], fill='gray30',
+                               anchor='n' if 0 < i < 5 else ('nw' if i == 0 else 'ne'))
+
+        draw_ms = (time.perf_counter() - start) * 1000
+        self.status.config(text=f"{data['total']:,}問 / {len(data['keys']):,}セッション  "
+                                f"(読み込み {self.load_ms:.0f}ms, 描画 {draw_ms:.0f}ms)")
+
+    def _draw_axes(self, panel, plot_width, title, label):
+        top, panel_height, low, high = panel
+        canvas = self.canvas
+        canvas.create_text(MARGIN_LEFT, top - 6, text=title, anchor='sw', fill='gray20')
+        for i in range(5):
+            value = low + (high - low) * i / 4
+            y = top + panel_height * (1 - i / 4)
+            canvas.create_line(MARGIN_LEFT, y, MARGIN_LEFT + plot_width, y, fill='gray90')
+            canvas.create_text(MARGIN_LEFT - 6, y, text=label(value), anchor='e', fill='gray30')
+        canvas.create_rectangle(MARGIN_LEFT, top, MARGIN_LEFT + plot_width, top + panel_height, outline='gray60')
+
+
+def main():
+    root = tk.Tk()
+    root.withdraw()
+    chart = HistoryChart(root, get_settings())
+    root.wait_window(chart)
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import tempfile
+import time
+from dataclasses import replace
+
+from Question import QuizApp
+from quiz_engine import RandomAnswers, StdinAnswers
+from settings import get_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ウィンドウなしで合成セッションを生成する負荷テスト用ドライバ')
+    parser.add_argument('--sessions', type=int, default=1000, help='生成するセッション数')
+    parser.add_argument('--questions', type=int, default=get_settings().num_questions, help='1セッションの問題数')
+    parser.add_argument('--max-questions', type=int, default=None,
+                        help='誤答による追加を含めた最大問題数 (事前生成する問題数、省略時は問題数の3倍)')
+    parser.add_argument('--source', choices=['random', 'stdin'], default='random', help='回答元')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='合成回答の誤答率')
+    parser.add_argument('--mean-time', type=float, default=5.0, help='合成回答の平均時間 (秒)')
+    parser.add_argument('--seed', type=int, default=None, help='合成回答のシード')
+    parser.add_argument('--buffer', default=os.path.join(tempfile.gettempdir(), 'quiz_load_test.jsonl'),
+                        help='書き込み先のバッファファイル (本番のバッファとは分ける)')
+    parser.add_argument('--batch', type=int, default=100, help='バッファへまとめて追記するセッション数')
+    parser.add_argument('--history', default=None, help='ローカル履歴 (SQLite) にも書き込む場合のパス')
+    parser.add_argument('--upload', action='store_true', help='生成後にprocess_bufferでアップロードする')
+    parser.add_argument('--trace', default='', help='フェーズごとのトレースを書き込むパス (省略時は記録しない)')
+    args = parser.parse_args()
+
+    # 設定の最大問題数 (100) まで毎回事前生成すると生成が大半を占めるため、既定では問題数の3倍に抑える
+    # (誤答率10%では3倍を超えるセッションはほぼない)
+    max_questions = args.max_questions or args.questions * 3
+    settings = replace(get_settings(), trace_file=args.trace, max_questions=max_questions)
+    app = QuizApp(headless=True, buffer_file=args.buffer, settings=settings)
+    history = None
+    if args.history:
+        from history import HistoryStore
+        history = HistoryStore(args.history)
+    if args.source == 'stdin':
+        source = StdinAnswers()
+    else:
+        source = RandomAnswers(args.error_rate, args.mean_time, args.seed)
+
+    generate_time = build_time = save_time = history_time = 0.0
+    question_count = 0
+    batch, history_batch = {}, []
+    start = time.perf_counter()
+
+    for n in range(args.sessions):
+        t0 = time.perf_counter()
+        session_key = f"{app.generate_problems(args.questions, source=source)} #{n:06d}"
+        t1 = time.perf_counter()
+        batch[session_key] = app.build_session_data(session_key)
+        t2 = time.perf_counter()
+        question_count += len(app.questions)
+        generate_time += t1 - t0
+        build_time += t2 - t1
+        if history:
+            history_batch.append((session_key, app.settings.question_type, app.questions))
+
+        if len(batch) >= args.batch or n == args.sessions - 1:
+            if history:
+                # 履歴もバッファと同じ単位でまとめて書き込む (セッションごとのコミットを避ける)
+                history.add_sessions(history_batch)
+                history_batch = []
+                t3 = time.perf_counter()
+                history_time += t3 - t2
+                t2 = t3
+            if not app.file_operation('append', batch):
+                print("バッファ保存に失敗しました")
+                return
+            save_time += time.perf_counter() - t2
+            batch = {}
+
+    elapsed = time.perf_counter() - start
+    print(f"セッション: {args.sessions} ({args.sessions / elapsed:.0f}/秒), 問題: {question_count} ({question_count / elapsed:.0f}/秒)")
+    print(f"内訳: 出題・採点 {generate_time:.3f}秒, build_session_data {build_time:.3f}秒, バッファ保存 {save_time:.3f}秒")
+    print(f"バッファ: {args.buffer} ({os.path.getsize(args.buffer) / 1024:.0f}KB)")
+    if history:
+        print(f"履歴書き込み {history_time:.3f}秒")
+        start = time.perf_counter()
+        stats = history.stats(app.settings.question_type)
+        print(f"履歴集計: {stats} ({(time.perf_counter() - start) * 1000:.1f}ms)")
+
+    if args.upload:
+        start = time.perf_counter()
+        app.process_buffer()
+        print(f"アップロード: {time.perf_counter() - start:.1f}秒")
+    app.tracer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+
+NOTION_VERSION = '2022-06-28'
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限 (スレッドセーフ)"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得 (なければ補充まで待機)"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """全スレッドの送信を指定秒数止める (429対策)"""
+        with self.lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class NotionClient:
+    """接続プール・リトライ・レート制限付きのNotion APIクライアント"""
+    def __init__(self, api_key, rate_limit=3, pool_size=10, max_retries=5,
+                 backoff_base=0.5, backoff_max=30, timeout=30):
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Notion-Version': NOTION_VERSION,
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        # 計測用カウンタ
+        self.stats_lock = threading.Lock()
+        self.status_counts = Counter()
+        self.call_count = 0
+        self.retry_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _record(self, status, latency):
+        with self.stats_lock:
+            self.call_count += 1
+            self.status_counts[status] += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def _backoff(self, attempt, response=None):
+        """待機秒数 (Retry-Afterがあれば優先、なければジッター付き指数バックオフ)"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return float(retry_after) + random.uniform(0, self.backoff_base)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, data=None):
+        """リクエスト送信 (一時的なエラーはリトライし、最終的に失敗すれば例外)"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, json=data, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record('network_error', time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                wait = self._backoff(attempt)
+            else:
+                self._record(response.status_code, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                wait = self._backoff(attempt, response)
+                if response.status_code == 429:
+                    # 全スレッドを止め、次のacquireで待機させる
+                    self.rate_limiter.pause(wait)
+                    wait = 0
+
+            with self.stats_lock:
+                self.retry_count += 1
+            time.sleep(wait)
+
+    def post(self, url, data):
+        return self.request('POST', url, data)
+
+    def summary(self):
+        """計測結果の要約文字列"""
+        with self.stats_lock:
+            if not self.call_count:
+                return "Notion API 呼び出しなし"
+            avg = self.latency_total / self.call_count
+            statuses = ', '.join(f"{k}: {v}" for k, v in sorted(self.status_counts.items(), key=str))
+            return (f"Notion API 呼び出し: {self.call_count}回 (リトライ {self.retry_count}回), "
+                    f"平均 {avg * 1000:.0f}ms, 最大 {self.latency_max * 1000:.0f}ms, [{statuses}]")
@@ -0,0 +1,94 @@
+import random
+from functools import lru_cache
+
+SMALL_DIGITS = 16  # これ以下の桁数は単純なループで変換
+MAX_RETRIES = 100  # 重複回避の再抽選回数 (組み合わせが尽きたら重複を許す)
+TABLE_DIGITS = 4  # これ以下の桁数は変換表を引く (9**4 = 6561件)
+
+
+@lru_cache(maxsize=None)
+def _pow(base, exp):
+    return base ** exp
+
+
+def digits_from_index(v, num_digits):
+    """0 <= v < 9**num_digits を各桁1〜9の10進数に変換 (文字列を経由しない)"""
+    if num_digits <= SMALL_DIGITS:
+        x, place = 0, 1
+        for _ in range(num_digits):
+            v, d = divmod(v, 9)
+            x += (d + 1) * place
+            place *= 10
+        return x
+    # 大きな桁数は上位・下位に分割して再帰 (分割統治の基数変換)
+    k = num_digits // 2
+    hi, lo = divmod(v, _pow(9, k))
+    return digits_from_index(hi, num_digits - k) * _pow(10, k) + digits_from_index(lo, k)
+
+
+@lru_cache(maxsize=None)
+def digits_table(num_digits):
+    """全インデックスの変換結果 (digits_from_indexのループを1問ごとに回さない)"""
+    return tuple(digits_from_index(v, num_digits) for v in range(9 ** num_digits))
+
+
+def index_from_digits(x, num_digits):
+    """digits_from_indexの逆変換"""
+    v, place = 0, 1
+    for _ in range(num_digits):
+        x, d = divmod(x, 10)
+        v += (d - 1) * place
+        place *= 9
+    return v
+
+
+class ProblemGenerator:
+    """問題 (X, Y, R, Z) の一括生成器 (Z = X * Y + R, 1 <= R < X)"""
+    def __init__(self, num_digits, question_type='掛け算', seed=None, unique=False, sampler=None):
+        self.num_digits = num_digits
+        self.question_type = question_type
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.unique = unique
+        self.seen = set()
+        self.space = 9 ** num_digits
+        self.table = digits_table(num_digits) if num_digits <= TABLE_DIGITS else None
+        self.sampler = sampler  # 指定時は (X, Y) を苦手な組み合わせほど高い確率で選ぶ
+
+    def key(self, problem):
+        """重複判定に使う組み合わせ (掛け算は(X, Y)、割り算は(Z, X))"""
+        X, Y, R, Z = problem
+        return (Z, X) if self.question_type == '割り算' else (X, Y)
+
+    def _draw(self):
+        randrange = self.rng.randrange
+        if self.sampler:
+            X, Y = self.sampler.sample(self.rng)
+        elif self.table:
+            X = self.table[randrange(self.space)]
+            Y = self.table[randrange(self.space)]
+        else:
+            X = digits_from_index(randrange(self.space), self.num_digits)
+            Y = digits_from_index(randrange(self.space), self.num_digits)
+        R = randrange(1, X) if X > 1 else 0
+        return (X, Y, R, X * Y + R)
+
+    def generate(self, count):
+        """count問をまとめて生成"""
+        problems = []
+        draw, key, seen = self._draw, self.key, self.seen
+        for _ in range(count):
+            problem = draw()
+            if self.unique:
+                for _ in range(MAX_RETRIES):
+                    if key(problem) not in seen:
+                        break
+                    problem = draw()
+                seen.add(key(problem))
+            problems.append(problem)
+        return problems
+
+    def __iter__(self):
+        """事前生成分を使い切った後の追加生成用"""
+        while True:
+            yield self.generate(1)[0]
@@ -0,0 +1,222 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from records import QuestionRecord
+
+PAGE_SIZE = 100  # Notion APIの1回あたりの最大件数
+QUESTION_PATTERN = re.compile(r'(-?\d+)\s*([×÷])\s*(-?\d+)')
+SHARED_TITLE = '個別の問題'
+
+
+def property_value(prop):
+    """Notionのプロパティ (取得時の形式) を値に変換"""
+    kind = prop.get('type') or next((k for k in ('title', 'rich_text', 'number', 'select') if k in prop), None)
+    value = prop.get(kind)
+    if kind in ('title', 'rich_text'):
+        return ''.join(t.get('plain_text', '') for t in value or [])
+    if kind == 'select':
+        return value and value.get('name')
+    return value
+
+
+def _integer(value):
+    """数値・表セルの文字列を整数に (空欄はNone)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = float(value) if '.' in value or 'e' in value else int(value)
+    return int(value)
+
+
+def record_from_values(values):
+    """列名 -> 値の辞書から問題記録を復元 (被演算子は問題文と正答から求める)"""
+    match = QUESTION_PATTERN.fullmatch((values.get('問題') or '').strip())
+    if not match or values.get('時間') in (None, ''):
+        return None
+    a, b = int(match[1]), int(match[3])
+    time = float(values['時間'])
+    correct = values.get('正誤判定') == '正解'
+    if match[2] == '÷':
+        Y, R = _integer(values.get('正答(商)')), _integer(values.get('正答(余)'))
+        if Y is None or R is None:
+            Y, R = divmod(a, b)
+        return QuestionRecord('割り算', b, Y, R, _integer(values.get('回答(商)')),
+                              _integer(values.get('回答(余)')), time, correct)
+    Z = _integer(values.get('正答'))
+    R = 0 if Z is None else Z - a * b
+    return QuestionRecord('掛け算', a, b, R, _integer(values.get('回答')), None, time, correct)
+
+
+class PullSync:
+    """Notionのセッション・個別問題を差分取得してローカル履歴 (HistoryStore) に取り込む
+
+    セッションのデータベースをlast_edited_timeの昇順で取得し、最後に取り込めたページの
+    日時をnotion_cache.jsonにカーソルとして保存する (次回はそれ以降に編集されたページのみ)。
+    個別問題は子データベース・表ブロック・共有データベースのいずれからも読み込む。
+    リクエストはアップロードと同じNotionClientを通すため、レート制限を共有する。
+    """
+    def __init__(self, app, history):
+        self.app = app
+        self.settings = app.settings
+        self.history = history
+        self._shared = None
+        self._shared_lock = threading.Lock()
+
+    def _pages(self, url, body=None, method='POST'):
+        """ページネーションしながら結果をバッチごとに返す (失敗時はNoneを返して終了)"""
+        cursor = None
+        while True:
+            if method == 'GET':
+                query = f"?page_size={PAGE_SIZE}" + (f"&start_cursor={cursor}" if cursor else '')
+                result = self.app.notion_request(url + query, None, method='GET')
+            else:
+                data = dict(body or {}, page_size=PAGE_SIZE)
+                if cursor:
+                    data['start_cursor'] = cursor
+                result = self.app.notion_request(url, data)
+            if result is None:
+                yield None
+                return
+            yield result.get('results', [])
+            if not result.get('has_more'):
+                return
+            cursor = result['next_cursor']
+
+    def _all(self, url, body=None, method='POST'):
+        results = []
+        for batch in self._pages(url, body, method):
+            if batch is None:
+                return None
+            results.extend(batch)
+        return results
+
+    def shared_databases(self):
+        """このセッションのデータベースに紐づく共有データベースのID (キャッシュになければ検索)"""
+        with self._shared_lock:
+            if self._shared is not None:
+                return self._shared
+            prefix = f"{self.settings.database_id}/"
+            entries = self.app.load_notion_cache().get('shared_databases', {})
+            shared = [entry['id'] for key, entry in entries.items() if key.startswith(prefix)]
+            if not shared:
+                result = self.app.notion_request(f"{self.settings.notion_api_url}/search", {
+                    'query': SHARED_TITLE, 'filter': {'property': 'object', 'value': 'database'}})
+                if result is None:
+                    return None
+                for question_type in ('掛け算', '割り算'):
+                    entry = self.app._match_shared_database(result.get('results', []),
+                                                            f"{SHARED_TITLE} ({question_type})")
+                    if entry:
+                        shared.append(entry['id'])
+            self._shared = shared
+            return shared
+
+    def fetch_questions(self, page_id):
+        """セッションページの個別問題を列名 -> 値の辞書のリストで返す (失敗時はNone)"""
+        url_database, url_blocks = self.app.url_database, self.app.url_blocks
+        blocks = self._all(f"{url_blocks}/{page_id}/children", method='GET')
+        if blocks is None:
+            return None
+        rows = []
+        for block in blocks:
+            if block.get('type') == 'child_database':
+                pages = self._all(f"{url_database}/{block['id']}/query", {})
+                if pages is None:
+                    return None
+                rows += [{name: property_value(p) for name, p in page['properties'].items()} for page in pages]
+            elif block.get('type') == 'table':
+                table_rows = self._all(f"{url_blocks}/{block['id']}/children", method='GET')
+                if table_rows is None:
+                    return None
+                cells = [[''.join(t.get('plain_text', '') for t in cell) for cell in row['table_row']['cells']]
+                         for row in table_rows if row.get('type') == 'table_row']
+                if cells:
+                    rows += [dict(zip(cells[0], values)) for values in cells[1:]]
+        if rows:
+            return rows
+
+        # 子データベース・表がなければ共有データベースからリレーションで絞り込む
+        shared = self.shared_databases()
+        if shared is None:
+            return None
+        body = {'filter': {'property': 'セッション', 'relation': {'contains': page_id}}}
+        for database_id in shared:
+            pages = self._all(f"{url_database}/{database_id}/query", body)
+            if pages is None:
+                return None
+            rows += [{name: property_value(p) for name, p in page['properties'].items()} for page in pages]
+        return rows
+
+    def pull_session(self, page):
+        """セッション1件を取り込む ('imported' / 'skipped' / 'incomplete'、失敗時はNone)"""
+        props = {name: property_value(p) for name, p in page.get('properties', {}).items()}
+        session_key = props.get('名前')
+        count = _integer(props.get('問題数'))
+        if not session_key or not count:
+            return 'skipped'
+        # この端末で記録したセッションは問題を取得し直さない
+        if self.history.question_count(session_key) == count:
+            return 'skipped'
+
+        with self.app.tracer.span('pull_session', session=session_key) as span:
+            rows = self.fetch_questions(page['id'])
+            span['ok'] = rows is not None
+        if rows is None:
+            return None
+        rows.sort(key=lambda values: _integer(values.get('問題番号')) or 0)
+        questions = [q for q in map(record_from_values, rows) if q is not None]
+        if len(questions) < count:
+            return 'incomplete'  # 他の端末がアップロード中
+        question_type = questions[0].type
+        self.history.add_session(session_key, question_type, questions)
+        return 'imported'
+
+    def run(self):
+        """差分取得を実行し、件数の辞書を返す (取得に失敗した場合はNone)"""
+        database_id = self.settings.database_id
+        cache = self.app.load_notion_cache()
+        cursor = cache.get('pull_cursors', {}).get(database_id)
+        incomplete = dict(cache.get('pull_incomplete', {}).get(database_id, {}))
+
+        body = {'sorts': [{'timestamp': 'last_edited_time', 'direction': 'ascending'}]}
+        if cursor:
+            body['filter'] = {'timestamp': 'last_edited_time', 'last_edited_time': {'on_or_after': cursor}}
+
+        counts = {'imported': 0, 'skipped': 0, 'incomplete': 0}
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.settings.upload_workers) as executor:
+            # 次のバッチを取得している間も前のバッチのセッションを並列に取り込む
+            futures = []
+            for batch in self._pages(f"{self.app.url_database}/{database_id}/query", body):
+                if batch is None:
+                    failed = True
+                    break
+                futures += [(page, executor.submit(self.pull_session, page)) for page in batch
+                            if page['id'] not in incomplete]
+            # 前回アップロード途中だったセッションは編集日時に関係なく再取得
+            retries = [(page_id, executor.submit(self.pull_session, {'id': page_id, 'properties': props}))
+                       for page_id, props in incomplete.items()]
+
+            for page, future in futures:
+                result = future.result()
+                if result is None:
+                    failed = True
+                    continue
+                counts[result] += 1
+                if result == 'incomplete':
+                    incomplete[page['id']] = page['properties']
+                if not failed:
+                    # 失敗したページより前までカーソルを進める (昇順なので再取得は失敗分以降)
+                    cursor = page['last_edited_time']
+            for page_id, future in retries:
+                result = future.result()
+                if result is not None:
+                    counts[result] += 1
+                    if result != 'incomplete':
+                        del incomplete[page_id]
+
+        if cursor:
+            self.app.update_notion_cache('pull_cursors', database_id, cursor)
+        self.app.update_notion_cache('pull_incomplete', database_id, incomplete)
+        return None if failed else counts
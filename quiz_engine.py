@@ -0,0 +1,162 @@
+import itertools
+import random
+import sys
+import time
+from collections import namedtuple
+
+from problem_generator import ProblemGenerator
+from records import QuestionRecord
+from stats import SessionStats
+
+# 回答元に渡す問題情報 (expectedは合成回答用の正答入力文字列)
+Prompt = namedtuple('Prompt', ['title', 'question', 'show_r_button', 'expected'])
+
+
+class QuizEngine:
+    """UIに依存しない出題・採点処理"""
+    def __init__(self, question_type, num_digits, count, add_on_mistake=1, max_questions=100,
+                 seed=None, unique=True, debug=False, sampler=None):
+        self.question_type = question_type
+        self.count = count
+        self.add_on_mistake = add_on_mistake
+        self.max_questions = max_questions
+        self.debug = debug
+        self.correct = 0
+        self.questions = []
+        self.stats = SessionStats()
+        self.sampler = sampler
+
+        self.generator = ProblemGenerator(num_digits, question_type, seed=seed, unique=unique, sampler=sampler)
+        if sampler:
+            # 回答ごとに重みが変わるため1問ずつ抽選 (1問あたりO(log n))
+            self.problems = iter(self.generator)
+        else:
+            # 追加問題を含めた最大数まで事前に一括生成 (足りなければ追加生成)
+            self.problems = itertools.chain(self.generator.generate(max(count, max_questions)), self.generator)
+        if debug:
+            print(f"デバッグ: シード={self.generator.seed}")
+
+    def __iter__(self):
+        """規定数に正解するまで問題を返す"""
+        while self.correct < self.count:
+            yield next(self.problems)
+
+    def prompt(self, problem):
+        """問題文を作成"""
+        X, Y, R, Z = problem
+        remaining = self.count - self.correct
+        if self.debug:
+            print(f"デバッグ: Z={Z},X={X}, Y={Y}, R={R}, 残り={remaining}, タイプ={self.question_type}")
+
+        if self.question_type == "割り算":
+            return Prompt("割り算問題", f"残り問題数：{remaining}問題: {Z} ÷ {X} = ? 余り ?", True, f"{Y}余り{R}")
+        return Prompt("掛け算問題", f"残り問題数：{remaining}問題: {X} × {Y}+{R} = ?", False, str(Z))
+
+    @staticmethod
+    def normalize_answer(line, show_r_button):
+        """キーボード入力の回答を採点用の形式に (割り算は「商 余り」も「商余り余り」として扱う)"""
+        line = line.strip()
+        if show_r_button and ' ' in line and '余り' not in line:
+            line = line.replace(' ', '余り', 1)
+        return line
+
+    @staticmethod
+    def safe_int(value):
+        """安全な整数変換"""
+        return int(value) if value and value.isdigit() else 0
+
+    def grade(self, problem, user_input, elapsed_time):
+        """採点して問題記録を追加し、(記録, 結果メッセージ) を返す"""
+        X, Y, R, Z = problem
+
+        if self.question_type == "割り算":
+            user_quotient, user_remainder = 0, 0
+            if user_input:
+                if '余り' in user_input:
+                    parts = user_input.split('余り', 1)
+                    user_quotient = self.safe_int(parts[0])
+                    user_remainder = self.safe_int(parts[1]) if len(parts) > 1 and parts[1] else 0
+                else:
+                    user_quotient = self.safe_int(user_input)
+
+            is_correct = (Y == user_quotient and R == user_remainder)
+            question_data = QuestionRecord(self.question_type, X, Y, R, user_quotient, user_remainder,
+                                           elapsed_time, is_correct)
+            display_correct_answer = f"{Y} 余り {R}"
+        else: # 掛け算
+            user_answer = self.safe_int(user_input)
+            is_correct = (Z == user_answer)
+            question_data = QuestionRecord(self.question_type, X, Y, R, user_answer, None,
+                                           elapsed_time, is_correct)
+            display_correct_answer = Z
+
+        result_msg = f"{question_data.judge} {elapsed_time:.2f}秒"
+
+        if is_correct:
+            self.correct += 1
+        else:
+            result_msg += f"\n正解: {display_correct_answer}"
+            added = min(self.add_on_mistake, self.max_questions - self.count)
+            if added > 0:
+                self.count += added
+                result_msg += f"\n({added}問追加されました)"
+
+        self.questions.append(question_data)
+        self.stats.add(question_data)
+        if self.sampler:
+            self.sampler.update(X, Y, is_correct, elapsed_time)
+        return question_data, result_msg
+
+    def run(self, source, on_result=None):
+        """回答元sourceから回答を受け取りながら全問実行"""
+        for problem in self:
+            try:
+                user_input, elapsed_time = source.answer(self.prompt(problem))
+            except (StopIteration, EOFError):
+                # 回答元が尽きたら途中で終了
+                break
+            question_data, result_msg = self.grade(problem, user_input, elapsed_time)
+            if on_result:
+                on_result(question_data, result_msg)
+        return self.questions
+
+
+class ScriptedAnswers:
+    """用意した回答を順に返す (要素は文字列または (文字列, 秒))"""
+    def __init__(self, answers, default_time=1.0):
+        self.answers = iter(answers)
+        self.default_time = default_time
+
+    def answer(self, prompt):
+        item = next(self.answers)
+        if isinstance(item, tuple):
+            return item
+        return item, self.default_time
+
+
+class RandomAnswers:
+    """指定した誤答率で正答/誤答を返す合成回答 (時間は対数正規分布)"""
+    def __init__(self, error_rate=0.1, mean_time=5.0, seed=None):
+        self.error_rate = error_rate
+        self.mean_time = mean_time
+        self.rng = random.Random(seed)
+
+    def answer(self, prompt):
+        elapsed_time = self.rng.lognormvariate(0, 0.5) * self.mean_time
+        if self.rng.random() >= self.error_rate:
+            return prompt.expected, elapsed_time
+        return str(self.rng.randrange(10 ** len(prompt.expected))), elapsed_time
+
+
+class StdinAnswers:
+    """標準入力から回答を読む (割り算は「商余り余り」または「商 余り」)"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+
+    def answer(self, prompt):
+        print(prompt.question, flush=True)
+        start_time = time.perf_counter()
+        line = self.stream.readline()
+        if not line:
+            raise EOFError
+        return QuizEngine.normalize_answer(line, prompt.show_r_button), time.perf_counter() - start_time
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime
+from urllib.parse import unquote, urlsplit
+
+from Question import QuizApp
+from quiz_engine import QuizEngine
+from settings import get_settings
+
+QUESTION_TYPES = ('掛け算', '割り算')
+MAX_BODY = 64 * 1024
+MAX_ANSWER_TIME = 3600  # クライアントが申告する回答時間の上限 (秒)
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+INDEX_HTML = """<!doctype html>
+<html lang="ja"><head><meta charset="utf-8"><title>計算問題</title></head>
+<body style="font-family: sans-serif; max-width: 480px; margin: 2em auto">
+<div id="start">
+  名前 <input id="learner" size="12">
+  <select id="type"><option>掛け算</option><option>割り算</option></select>
+  <button onclick="start()">開始</button>
+</div>
+<div id="quiz" hidden>
+  <p id="question" style="font-size: 1.4em"></p>
+  <input id="answer" size="16" style="font-size: 1.4em" onkeydown="if (event.key === 'Enter') send()">
+  <button onclick="send()">OK</button>
+  <p id="hint"></p>
+</div>
+<pre id="result"></pre>
+<script>
+let sessionId = null, shownAt = 0;
+async function call(method, path, body) {
+  const response = await fetch(path, {method, body: body && JSON.stringify(body)});
+  return response.json();
+}
+function show(data) {
+  const quiz = document.getElementById('quiz');
+  if (data.summary) {
+    quiz.hidden = true;
+    document.getElementById('start').hidden = false;
+    document.getElementById('result').textContent += '\\n' + data.summary.text;
+    return;
+  }
+  quiz.hidden = false;
+  document.getElementById('question').textContent = data.prompt.question;
+  document.getElementById('hint').textContent = data.prompt.show_r_button ? '商と余りは空白で区切る (例: 12 3)' : '';
+  const answer = document.getElementById('answer');
+  answer.value = '';
+  answer.focus();
+  shownAt = performance.now();
+}
+async function start() {
+  const learner = document.getElementById('learner').value.trim();
+  if (!learner) return;
+  const data = await call('POST', '/api/sessions', {learner, type: document.getElementById('type').value});
+  if (data.error) { alert(data.error); return; }
+  sessionId = data.session_id;
+  document.getElementById('start').hidden = true;
+  document.getElementById('result').textContent = '';
+  show(data);
+}
+async function send() {
+  const time = (performance.now() - shownAt) / 1000;
+  const data = await call('POST', `/api/sessions/${sessionId}/answer`,
+                          {answer: document.getElementById('answer').value, time});
+  if (data.error) { alert(data.error); return; }
+  document.getElementById('result').textContent = data.result;
+  show(data);
+}
+</script>
+</body></html>
+"""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LearnerSession:
+    """1人の学習者の実行中のセッション (出題・採点はQuizEngine)"""
+    def __init__(self, session_id, learner, question_type, engine):
+        self.session_id = session_id
+        self.learner = learner
+        self.question_type = question_type
+        self.engine = engine
+        self.problems = iter(engine)
+        self.problem = None
+        self.prompt = None
+        self.shown_at = None
+        self.last_active = time.monotonic()
+
+    def next_prompt(self):
+        """次の問題を出題 (規定数に正解していればNone)"""
+        self.problem = next(self.problems, None)
+        self.prompt = None if self.problem is None else self.engine.prompt(self.problem)
+        self.shown_at = time.monotonic()
+        return self.prompt
+
+    def answer(self, user_input, elapsed_time=None):
+        """採点して (記録, 結果メッセージ) を返す (時間の申告がなければサーバーで計測)"""
+        if elapsed_time is None:
+            elapsed_time = time.monotonic() - self.shown_at
+        self.last_active = time.monotonic()
+        user_input = QuizEngine.normalize_answer(user_input, self.prompt.show_r_button)
+        return self.engine.grade(self.problem, user_input, elapsed_time)
+
+
+class QuizServer:
+    """複数の学習者に同時に出題するHTTPサーバー (asyncio)
+
+    学習者ごとにQuizEngineを持ち、終了したセッションは1つの共有バッファに追記する。
+    アップロードは1つのタスクが共有のQuizApp.process_bufferで行うため、
+    接続プールとNotionのレート制限は全学習者で共有される。
+    """
+    def __init__(self, app):
+        self.app = app
+        self.settings = app.settings
+        self.sessions = {}  # セッションID -> LearnerSession
+        self.learners = defaultdict(list)  # 学習者 -> 終了したセッションの要約
+        self.upload_wanted = asyncio.Event()
+        self.uploading = False
+        self.owns_sync = False
+
+    # --- セッション ---
+
+    def create_session(self, body):
+        learner = str(body.get('learner', '')).strip()
+        if not learner or len(learner) > 50:
+            raise HTTPError(400, "learnerを1〜50文字で指定してください")
+        question_type = body.get('type', self.settings.question_type)
+        if question_type not in QUESTION_TYPES:
+            raise HTTPError(400, f"typeは {' / '.join(QUESTION_TYPES)} のいずれかです")
+        settings = self.settings
+        count = body.get('num_questions', settings.num_questions)
+        if not isinstance(count, int) or not 1 <= count <= settings.max_questions:
+            raise HTTPError(400, f"num_questionsは1〜{settings.max_questions}の整数です")
+
+        # 学習者ごとに苦手分析の重みが異なるため、サーバーモードでは一様に出題
+        engine = QuizEngine(question_type, settings.num_digits, count, settings.add_questions_on_mistake,
+                            settings.max_questions, seed=settings.seed, unique=settings.unique_problems)
+        session = LearnerSession(secrets.token_urlsafe(12), learner, question_type, engine)
+        self.sessions[session.session_id] = session
+        print(f"開始: {learner} ({question_type} {count}問) [{len(self.sessions)}人が回答中]")
+        return session
+
+    async def finish_session(self, session):
+        """回答済みの問題を共有バッファと履歴に保存し、要約を返す"""
+        self.sessions.pop(session.session_id, None)
+        engine = session.engine
+        # 同時に終了した学習者とキーが重ならないよう学習者名を付ける (日付順の並びは保たれる)。
+        # 同じ名前で複数のブラウザから回答した場合に同じ秒で終了しても上書きしないよう、セッションIDの先頭も付ける
+        # (セッションは削除済みなので、このIDで回答を続けることはできない)
+        session_key = f"{datetime.now():%Y-%m-%d %H:%M:%S} {session.learner} #{session.session_id[:8]}"
+        summary = {
+            'session_key': session_key,
+            'count': engine.stats.count,
+            'accuracy': engine.stats.accuracy,
+            'mean_time': engine.stats.mean,
+            'text': f"{session_key}\n{engine.stats.summary_text()}",
+        }
+        if not engine.questions:
+            return summary
+
+        saved = await asyncio.to_thread(self._save, session_key, session)
+        summary['saved'] = bool(saved)
+        self.learners[session.learner].append(summary)
+        print(f"終了: {session.learner} {engine.stats.count}問 正答率 {engine.stats.accuracy:.1%}")
+        self.upload_wanted.set()
+        return summary
+
+    def _save(self, session_key, session):
+        """共有バッファへの追記と履歴への記録 (スレッドで実行し、イベントループを止めない)"""
+        questions = session.engine.questions
+        with self.app.tracer.span('server_finish', learner=session.learner, questions=len(questions)):
+            data = self.app.build_session_data(session_key, questions, session.question_type)
+            saved = self.app.file_operation('append', {session_key: data})
+            self.app.record_history(session_key, questions, session.question_type)
+        return saved
+
+    def _upload(self):
+        with self.app.tracer.span('sync', server=True):
+            return self.app.process_buffer()
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, "セッションが見つかりません (終了済みまたは期限切れ)")
+        return session
+
+    @staticmethod
+    def prompt_json(prompt):
+        # expected (正答) はクライアントに渡さない
+        return {'title': prompt.title, 'question': prompt.question, 'show_r_button': prompt.show_r_button}
+
+    async def answer(self, session, body):
+        if not isinstance(body.get('answer'), str):
+            raise HTTPError(400, "answerを文字列で指定してください")
+        elapsed_time = body.get('time')
+        if elapsed_time is not None and not (isinstance(elapsed_time, (int, float))
+                                             and 0 <= elapsed_time <= MAX_ANSWER_TIME):
+            elapsed_time = None  # 不正な申告はサーバーでの計測値を使う
+        question_data, result_msg = session.answer(body['answer'], elapsed_time)
+        self.app.tracer.add('answer', question_data.time, learner=session.learner)
+        response = {'correct': question_data.correct, 'result': result_msg}
+        prompt = session.next_prompt()
+        if prompt is None:
+            response['summary'] = await self.finish_session(session)
+        else:
+            response['prompt'] = self.prompt_json(prompt)
+        return response
+
+    # --- ルーティング ---
+
+    async def dispatch(self, method, path, body):
+        parts = [unquote(p) for p in path.strip('/').split('/')] if path.strip('/') else []
+        if not parts:
+            if method != 'GET':
+                raise HTTPError(405, "GETのみ対応しています")
+            return 200, INDEX_HTML
+        if parts[0] != 'api':
+            raise HTTPError(404, "見つかりません")
+        route = parts[1:]
+
+        if route == ['sessions'] and method == 'POST':
+            session = self.create_session(body)
+            return 201, {'session_id': session.session_id, 'prompt': self.prompt_json(session.next_prompt())}
+        if len(route) == 2 and route[0] == 'sessions':
+            session = self.get_session(route[1])
+            if method == 'GET':
+                return 200, {'learner': session.learner, 'answered': len(session.engine.questions),
+                             'stats': session.engine.stats.summary_text(),
+                             'prompt': session.prompt and self.prompt_json(session.prompt)}
+            if method == 'DELETE':
+                # 途中でやめた場合も回答済みの分は保存
+                return 200, {'summary': await self.finish_session(session)}
+        if len(route) == 3 and route[0] == 'sessions' and route[2] == 'answer' and method == 'POST':
+            return 200, await self.answer(self.get_session(route[1]), body)
+        if len(route) == 2 and route[0] == 'learners' and method == 'GET':
+            active = [s.session_id for s in self.sessions.values() if s.learner == route[1]]
+            return 200, {'learner': route[1], 'active_sessions': active, 'finished': self.learners.get(route[1], [])}
+        if route == ['status'] and method == 'GET':
+            pending = await asyncio.to_thread(self.app.file_operation, 'load')
+            return 200, {'active_sessions': len(self.sessions),
+                         'learners': sorted({s.learner for s in self.sessions.values()} | set(self.learners)),
+                         'buffered_sessions': len(pending), 'uploading': self.uploading,
+                         'notion': self.app.notion.summary()}
+        raise HTTPError(404, "見つかりません")
+
+    # --- HTTP ---
+
+    async def handle(self, reader, writer):
+        """1接続分の処理 (keep-alive対応の最小限のHTTP/1.1)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    writer.write(self.response(413, {'error': "リクエストが大きすぎます"}, False))
+                    break
+                raw = await reader.readexactly(length) if length else b''
+                try:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except json.JSONDecodeError:
+                        raise HTTPError(400, "JSONの形式が正しくありません")
+                    if not isinstance(body, dict):
+                        raise HTTPError(400, "JSONオブジェクトを送ってください")
+                    status, payload = await self.dispatch(method, urlsplit(target).path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    print(f"サーバーエラー ({method} {target}): {e}")
+                    status, payload = 500, {'error': "サーバーエラー"}
+                writer.write(self.response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def response(status, payload, keep_alive):
+        if isinstance(payload, str):
+            data, content_type = payload.encode('utf-8'), 'text/html; charset=utf-8'
+        else:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode('latin-1') + data
+
+    # --- バックグラウンド処理 ---
+
+    async def upload_loop(self):
+        """共有バッファのアップロード (1本のみ、終了通知をまとめて送信し、失敗時は間隔を延ばす)"""
+        interval = self.settings.sync_interval
+        while True:
+            try:
+                await asyncio.wait_for(self.upload_wanted.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.upload_wanted.clear()
+            if not self.owns_sync:
+                continue  # 別の同期プロセスがアップロードする
+            self.uploading = True
+            try:
+                success = await asyncio.to_thread(self._upload)
+            finally:
+                self.uploading = False
+            if success is False:
+                interval = min(interval * 2, self.settings.sync_max_interval)
+                print(f"{interval:.0f}秒後に再試行します")
+            else:
+                interval = self.settings.sync_interval
+            await asyncio.to_thread(self.app.tracer.write_metrics)
+
+    async def expire_loop(self):
+        """回答のないセッションを打ち切り、回答済みの分を保存"""
+        timeout = self.settings.server_session_timeout
+        while True:
+            await asyncio.sleep(min(timeout, 60))
+            now = time.monotonic()
+            for session in [s for s in self.sessions.values() if now - s.last_active > timeout]:
+                print(f"期限切れ: {session.learner}")
+                await self.finish_session(session)
+
+    async def serve(self, host, port):
+        # 同期プロセス (--sync) が起動中ならアップロードは任せ、バッファへの追記のみ行う
+        self.owns_sync = self.app.buffer.sync_lock.acquire(blocking=False)
+        if not self.owns_sync:
+            print("同期プロセスが起動中のため、アップロードはそちらで行います")
+        server = await asyncio.start_server(self.handle, host, port)
+        tasks = [asyncio.create_task(self.upload_loop()), asyncio.create_task(self.expire_loop())]
+        self.upload_wanted.set()  # 前回の残りを送信
+        print(f"=== サーバー起動: http://{host}:{port}/ ===")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for session in list(self.sessions.values()):
+                await self.finish_session(session)
+            if self.owns_sync:
+                await asyncio.to_thread(self.app.process_buffer)
+                self.app.buffer.sync_lock.release()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='複数の学習者に同時に出題するサーバー (ブラウザまたはHTTP APIで回答)')
+    parser.add_argument('--host', default=settings.server_host, help='待ち受けアドレス (教室内に公開するなら 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=settings.server_port)
+    args = parser.parse_args()
+
+    # 学習者ごとの回答中の送信は行わず、終了したセッションを共有バッファからまとめて送る
+    app = QuizApp(headless=True, settings=replace(settings, stream_upload=False))
+    try:
+        asyncio.run(QuizServer(app).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("サーバーを終了します")
+    finally:
+        app.tracer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+BUFFER_FORMAT = 2  # 列形式のセッション記録 (1: Notionのペイロードをそのまま保存)
+
+
+class QuestionRecord:
+    """1問分の記録 (割り算ではanswerが商、remainderが余り)"""
+    __slots__ = ('type', 'X', 'Y', 'R', 'answer', 'remainder', 'time', 'correct')
+
+    def __init__(self, question_type, X, Y, R, answer, remainder, time, correct):
+        self.type = question_type
+        self.X = X
+        self.Y = Y
+        self.R = R
+        self.answer = answer
+        self.remainder = remainder
+        self.time = time
+        self.correct = correct
+
+    @property
+    def Z(self):
+        return self.X * self.Y + self.R
+
+    @property
+    def operands(self):
+        return (self.X, self.Y, self.R, self.Z)
+
+    @property
+    def question(self):
+        if self.type == '割り算':
+            return f'{self.Z} ÷ {self.X}'
+        return f'{self.X} × {self.Y}'
+
+    @property
+    def judge(self):
+        return '正解' if self.correct else '誤解'
+
+    # 掛け算
+    @property
+    def correct_answer(self):
+        return self.Z
+
+    @property
+    def user_answer(self):
+        return self.answer
+
+    # 割り算
+    @property
+    def correct_quotient(self):
+        return self.Y
+
+    @property
+    def correct_remainder(self):
+        return self.R
+
+    @property
+    def user_quotient(self):
+        return self.answer
+
+    @property
+    def user_remainder(self):
+        return self.remainder
+
+    def __repr__(self):
+        return f"QuestionRecord({self.question}, {self.answer}, {self.remainder}, {self.time:.2f}秒, {self.judge})"
+
+
+def to_columns(questions):
+    """問題記録を列ごとの配列に変換 (Zは X * Y + R から復元するため保存しない)"""
+    columns = {
+        'X': [q.X for q in questions],
+        'Y': [q.Y for q in questions],
+        'R': [q.R for q in questions],
+        'answer': [q.answer for q in questions],
+        'time': [round(q.time, 3) for q in questions],
+        'correct': [int(q.correct) for q in questions],
+    }
+    if any(q.type == '割り算' for q in questions):
+        columns['remainder'] = [q.remainder for q in questions]
+    return columns
+
+
+def from_columns(question_type, columns):
+    """to_columnsの逆変換"""
+    remainders = columns.get('remainder') or [None] * len(columns['X'])
+    return [QuestionRecord(question_type, *values) for values in zip(
+        columns['X'], columns['Y'], columns['R'], columns['answer'], remainders,
+        columns['time'], map(bool, columns['correct']))]
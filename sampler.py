@@ -0,0 +1,176 @@
+import json
+import os
+from array import array
+
+from problem_generator import digits_from_index, index_from_digits
+
+MAX_PAIRS = 2 ** 21  # これを超える組み合わせ数 (NUM_DIGITS >= 4) では一様出題にする
+
+WEIGHTS_VERSION = 2  # 木の形式 (1は未出題の組み合わせも木に入れていた)
+
+# 重み = MIN_WEIGHT + ERROR_WEIGHT * 誤答率 + TIME_WEIGHT * (平均時間 / 全体の平均時間)
+# 未出題の組み合わせは UNSEEN_WEIGHT (木には入れず、一様な抽選で選ぶ)
+UNSEEN_WEIGHT = 1.0
+# 未出題の組み合わせ全体を選ぶ確率の上限 (NUM_DIGITS=3の約53万組をそのまま重み1で数えると、
+# 誤答ばかりの組み合わせでも出題される確率が1/6万程度にしかならない)
+EXPLORE_SHARE = 0.5
+MIN_WEIGHT = 0.2
+ERROR_WEIGHT = 8.0
+TIME_WEIGHT = 0.5
+TIME_RATIO_CAP = 3.0
+TIME_EMA = 0.3  # 組み合わせごとの時間の指数移動平均の係数
+
+
+class FenwickTree:
+    """重みの累積和 (更新・重み付き抽選ともにO(log n))"""
+    def __init__(self, tree):
+        self.tree = tree  # 1始まり、tree[0]は未使用
+        self.size = len(tree) - 1
+        self.top = 1 << self.size.bit_length()
+
+    @classmethod
+    def uniform(cls, size, value):
+        """全要素が同じ重みの木をO(n)で構築"""
+        return cls(array('d', (value * (i & -i) for i in range(size + 1))))
+
+    def add(self, i, delta):
+        """i番目 (0始まり) の重みにdeltaを加える"""
+        if not 0 <= i < self.size:
+            # 負の位置では i & -i が0になり終わらない
+            raise IndexError(f"位置 {i} が範囲外です (0〜{self.size - 1})")
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        i, s = self.size, 0.0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def find(self, target):
+        """累積和がtargetを超える最初の位置 (0始まり) を二分探索で求める"""
+        pos, step = 0, self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+class WeakSpotSampler:
+    """過去の誤答・回答時間で (X, Y) の組み合わせを重み付けして出題"""
+    def __init__(self, num_digits, path):
+        self.num_digits = num_digits
+        self.side = 9 ** num_digits
+        self.size = self.side * self.side
+        self.path = path  # 拡張子なし (.bin に木、.json に組み合わせごとの成績)
+        self.stats = {}  # 組み合わせ番号 -> [出題数, 誤答数, 時間の移動平均, 木に入っている重み]
+        self.time_mean = 0.0
+        self.time_count = 0
+        self.history_rowid = 0  # 反映済みの履歴 (HistoryStore.last_session_rowid)
+        self.tree = None
+
+    @classmethod
+    def supported(cls, num_digits):
+        return 9 ** (2 * num_digits) <= MAX_PAIRS
+
+    def load(self):
+        """保存済みの重みを読み込む (なければ空の木で初期化してFalseを返す)"""
+        try:
+            with open(self.path + '.json', 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            if meta.get('version') == WEIGHTS_VERSION and meta['size'] == self.size:
+                tree = array('d')
+                with open(self.path + '.bin', 'rb') as file:
+                    tree.fromfile(file, self.size + 1)
+                self.tree = FenwickTree(tree)
+                self.stats = {int(k): v for k, v in meta['stats'].items()}
+                self.time_mean = meta['time_mean']
+                self.time_count = meta['time_count']
+                self.history_rowid = meta.get('history_rowid', 0)
+                return True
+        except (OSError, ValueError, KeyError, EOFError):
+            pass
+        self.tree = FenwickTree.uniform(self.size, 0.0)
+        return False
+
+    def save(self):
+        """木は配列をそのまま書き出し、読み込み時に再構築しない"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.bin.tmp', 'wb') as file:
+            self.tree.tree.tofile(file)
+        meta = {'version': WEIGHTS_VERSION, 'size': self.size, 'time_mean': self.time_mean,
+                'time_count': self.time_count, 'history_rowid': self.history_rowid, 'stats': self.stats}
+        with open(self.path + '.json.tmp', 'w', encoding='utf-8') as file:
+            json.dump(meta, file, separators=(',', ':'))
+        os.replace(self.path + '.bin.tmp', self.path + '.bin')
+        os.replace(self.path + '.json.tmp', self.path + '.json')
+
+    def _weight(self, attempts, errors, ema_time):
+        time_ratio = min(ema_time / self.time_mean, TIME_RATIO_CAP) if self.time_mean else 1.0
+        return MIN_WEIGHT + ERROR_WEIGHT * errors / attempts + TIME_WEIGHT * time_ratio
+
+    def sample(self, rng):
+        """重みに比例して (X, Y) を1組選ぶ (未出題の組み合わせ全体の確率は EXPLORE_SHARE まで)"""
+        seen_total = self.tree.total()
+        unseen_total = UNSEEN_WEIGHT * (self.size - len(self.stats))
+        explore = min(unseen_total / (unseen_total + seen_total), EXPLORE_SHARE) if unseen_total else 0.0
+        if rng.random() < explore or seen_total <= 0:
+            # 全組み合わせから一様に選ぶ (出題済みの組み合わせに当たることもある)
+            idx = rng.randrange(self.size)
+        else:
+            idx = self.tree.find(rng.random() * seen_total)
+        a, b = divmod(idx, self.side)
+        return digits_from_index(a, self.num_digits), digits_from_index(b, self.num_digits)
+
+    def _valid(self, x):
+        """各桁が1〜9のnum_digits桁の数か (桁数の違う履歴の行を除く)"""
+        return (isinstance(x, int) and 10 ** (self.num_digits - 1) <= x < 10 ** self.num_digits
+                and '0' not in str(x))
+
+    def _index(self, X, Y):
+        return index_from_digits(X, self.num_digits) * self.side + index_from_digits(Y, self.num_digits)
+
+    def _apply(self, idx, attempts, errors, elapsed_time):
+        """組み合わせの成績を更新し、木の該当要素だけ差分更新"""
+        if not 0 <= idx < self.size:
+            return
+        stat = self.stats.get(idx)
+        if stat is None:
+            old_weight = 0.0
+            attempts, errors, ema_time = attempts, errors, elapsed_time
+        else:
+            old_weight = stat[3]
+            attempts, errors = stat[0] + attempts, stat[1] + errors
+            ema_time = stat[2] + TIME_EMA * (elapsed_time - stat[2])
+
+        self.time_count += 1
+        self.time_mean += (elapsed_time - self.time_mean) / self.time_count
+        weight = self._weight(attempts, errors, ema_time)
+        self.stats[idx] = [attempts, errors, ema_time, weight]
+        # 木には重みの差分だけを加える (全体の再構築はしない)
+        self.tree.add(idx, weight - old_weight)
+
+    def update(self, X, Y, correct, elapsed_time):
+        """回答結果を反映"""
+        self._apply(self._index(X, Y), 1, 0 if correct else 1, elapsed_time)
+
+    def load_history(self, rows):
+        """履歴の組み合わせごとの集計 (x, y, 出題数, 正解数, 平均時間) を反映
+
+        反映済みの出題数との差分だけを加えるため、この端末で回答して update 済みの問題は二重に数えず、
+        他の端末から取り込んだ問題だけが加わる (初回は全件)。
+        """
+        for X, Y, attempts, correct_count, avg_time in rows:
+            if self._valid(X) and self._valid(Y):
+                idx = self._index(X, Y)
+                stat = self.stats.get(idx)
+                known_attempts, known_errors = (stat[0], stat[1]) if stat else (0, 0)
+                if attempts > known_attempts:
+                    errors = max(attempts - correct_count - known_errors, 0)
+                    self._apply(idx, attempts - known_attempts, errors, avg_time)
@@ -0,0 +1,115 @@
+import json
+import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Optional
+
+# スクリプトの場所を基準に設定ファイルを読み込む
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(SCRIPT_DIR, 'ログ・設定', 'config.json')
+
+# config.json のキー名 (属性名と異なるもののみ)
+CONFIG_KEYS = {
+    'question_type': 'TYPE',
+}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """config.json の内容 (起動時に1回だけ読み込み、以降は変更しない)"""
+    notion_api_key: str = ''
+    database_id: str = ''
+    debug: bool = False
+    question_type: str = '掛け算'
+    log_file: str = 'activity_log.json'
+    buffer_compact_bytes: int = 1024 * 1024
+    num_digits: int = 3
+    add_questions_on_mistake: int = 1
+    num_questions: int = 10
+    max_questions: int = 100
+    seed: Optional[int] = None  # 指定すると同じ問題列を再現できる
+    unique_problems: bool = True  # セッション内で同じ組み合わせを出さない
+    notion_api_url: str = 'https://api.notion.com/v1'
+    notion_rate_limit: float = 3  # Notion APIの上限 (リクエスト/秒)
+    upload_workers: int = 4
+    notion_max_retries: int = 5
+    stream_upload: bool = True  # 回答中にバックグラウンドで送信
+    stream_drain_seconds: float = 3
+    # 'database': セッションごとにデータベースを作成 / 'shared': 問題種ごとの共有データベース / 'table': 表ブロックで一括送信
+    upload_mode: str = 'database'
+    shared_parent_page_id: str = ''  # 共有データベースの作成先 (空ならセッションのデータベースと同じページ)
+    notion_cache_file: str = 'notion_cache.json'  # 共有データベースのID・取り込みのカーソルのキャッシュ
+    history_file: str = 'history.sqlite3'
+    history_days: int = 30  # 終了時に比較する過去の期間 (日)
+    chart_cache_file: str = 'chart_cache.json'  # 成績の推移グラフの間引き済み系列
+    adaptive_sampling: bool = False  # 苦手な組み合わせを優先して出題
+    stats_properties: bool = False  # 分位点などの統計もセッションページに記録 (列は自動追加)
+    sync_interval: float = 60  # 同期プロセス (--sync) の送信間隔 (秒)
+    sync_max_interval: float = 900  # 失敗が続いたときの最大間隔 (秒)
+    pull_sync: bool = False  # 他の端末の結果をNotionから履歴に取り込む (終了時・同期プロセス)
+    server_host: str = '127.0.0.1'  # サーバーモード (quiz_server.py) の待ち受けアドレス (教室内では 0.0.0.0)
+    server_port: int = 8000
+    server_session_timeout: float = 1800  # 回答のないセッションを打ち切って保存するまでの秒数
+    trace_file: str = ''  # フェーズごとの所要時間 (空文字で無効、例: 'trace.jsonl')
+    metrics_file: str = ''  # Prometheusのtextfile (node_exporter用、空文字で無効)
+    profile: bool = False  # run() 全体をcProfileで計測
+    config_dir: str = os.path.dirname(CONFIG_PATH)
+
+    @property
+    def log_path(self):
+        """旧形式のバッファファイル (移行元)"""
+        return os.path.join(self.config_dir, self.log_file)
+
+    @property
+    def buffer_path(self):
+        """追記専用ジャーナル"""
+        return os.path.splitext(self.log_path)[0] + '.jsonl'
+
+    @property
+    def history_path(self):
+        """ローカル履歴 (SQLite)"""
+        return os.path.join(self.config_dir, self.history_file)
+
+    @property
+    def chart_cache_path(self):
+        return os.path.join(self.config_dir, self.chart_cache_file)
+
+    @property
+    def weights_path(self):
+        """苦手分析の重み (拡張子なし、問題種・桁数ごと)"""
+        return os.path.join(self.config_dir, f'weights_{self.question_type}_{self.num_digits}')
+
+    @property
+    def notion_cache_path(self):
+        return os.path.join(self.config_dir, self.notion_cache_file)
+
+    @property
+    def trace_path(self):
+        return os.path.join(self.config_dir, self.trace_file) if self.trace_file else None
+
+    @property
+    def metrics_path(self):
+        return os.path.join(self.config_dir, self.metrics_file) if self.metrics_file else None
+
+    @classmethod
+    def from_dict(cls, config, config_dir=None):
+        values = {}
+        for field in fields(cls):
+            key = CONFIG_KEYS.get(field.name, field.name.upper())
+            if key in config:
+                values[field.name] = config[key]
+        if config_dir:
+            values['config_dir'] = config_dir
+        return cls(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings(config_path=CONFIG_PATH):
+    """設定を読み込む (2回目以降はキャッシュを返す)"""
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        print(f"設定ファイルが見つかりません: {config_path} (デフォルト値で起動します)")
+        config = {}
+    return Settings.from_dict(config, os.path.dirname(config_path))
@@ -0,0 +1,117 @@
+import math
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class P2Quantile:
+    """P²アルゴリズムによる分位点の逐次推定 (5点のみ保持)"""
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # 中間の3点を理想位置に近づける (放物線補間、範囲外なら線形補間)
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return 0
+        if len(q) < 5:
+            # 5件未満は保持している値から直接求める
+            return q[min(len(q) - 1, round(self.p * (len(q) - 1)))]
+        return q[2]
+
+
+class SessionStats:
+    """採点ごとに更新する統計 (平均・分散はWelford法、分位点はP²法)"""
+    def __init__(self):
+        self.count = 0
+        self.correct = 0
+        self.total_time = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.quantiles = {p: P2Quantile(p) for p in QUANTILES}
+        # 割り算の商・余りを別々に集計
+        self.division_count = 0
+        self.quotient_correct = 0
+        self.remainder_correct = 0
+
+    @classmethod
+    def from_questions(cls, questions):
+        stats = cls()
+        for q in questions:
+            stats.add(q)
+        return stats
+
+    def add(self, q):
+        """問題記録1件を反映 (O(1))"""
+        t = q.time
+        self.count += 1
+        self.total_time += t
+        delta = t - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (t - self.mean)
+        for sketch in self.quantiles.values():
+            sketch.add(t)
+        if q.correct:
+            self.correct += 1
+        if q.type == '割り算':
+            self.division_count += 1
+            self.quotient_correct += q.user_quotient == q.correct_quotient
+            self.remainder_correct += q.user_remainder == q.correct_remainder
+
+    @property
+    def accuracy(self):
+        return self.correct / self.count if self.count else 0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+    def summary_text(self):
+        """キーパッドに表示する1〜2行の要約"""
+        if not self.count:
+            return ""
+        text = (f"正答 {self.correct}/{self.count} ({self.accuracy:.0%})  "
+                f"平均 {self.mean:.2f}秒 ±{self.stdev:.2f}\n"
+                f"中央値 {self.quantile(0.5):.2f}秒  p90 {self.quantile(0.9):.2f}秒  p99 {self.quantile(0.99):.2f}秒")
+        if self.division_count:
+            text += f"\n商 {self.quotient_correct}/{self.division_count}  余り {self.remainder_correct}/{self.division_count}"
+        return text
@@ -0,0 +1,72 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buffer_store import BufferStore  # noqa: E402
+
+WORKERS = 4
+SESSIONS_PER_WORKER = 60
+
+
+def _worker(path, worker_id):
+    """put・checkpoint・removeを繰り返す (圧縮が頻繁に起きるよう閾値を小さくする)"""
+    store = BufferStore(path, compact_bytes=2048)
+    for i in range(SESSIONS_PER_WORKER):
+        key = f"w{worker_id}-{i:03d}"
+        store.put(key, {'questions': list(range(10)), 'worker': worker_id})
+        store.checkpoint(key, main_page_id=f"page-{key}")
+        store.checkpoint(key, done=[0, 1])
+        store.checkpoint(key, done=[2])
+        if i % 2 == 0:
+            store.remove([key])
+    # バックグラウンドの圧縮 (末尾の引き継ぎ) が終わるまで待つ
+    while store.compacting:
+        time.sleep(0.01)
+
+
+def test_concurrent_processes_keep_all_sessions_and_progress(tmp_path):
+    path = str(tmp_path / 'buffer.jsonl')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker, args=(path, n)) for n in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+        assert process.exitcode == 0
+
+    sessions = BufferStore(path).load()
+    expected = {f"w{n}-{i:03d}" for n in range(WORKERS) for i in range(1, SESSIONS_PER_WORKER, 2)}
+    assert set(sessions) == expected
+    for key, data in sessions.items():
+        assert data['progress'] == {'main_page_id': f"page-{key}", 'done': [0, 1, 2]}
+
+    # 圧縮されていれば行数は書き込んだレコード数より少ない
+    with open(path, 'rb') as file:
+        lines = file.read().splitlines()
+    assert len(lines) < WORKERS * SESSIONS_PER_WORKER * 4
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(('.tmp', '.compact'))]
+
+
+def test_torn_last_line_is_skipped_and_not_joined(tmp_path):
+    """書き込み途中で落ちた末尾の行は無視し、次の追記と連結しない"""
+    path = str(tmp_path / 'buffer.jsonl')
+    BufferStore(path).put('a', {'n': 1})
+    with open(path, 'ab') as file:
+        file.write(b'{"op":"put","key":"torn","data":{"n"')
+
+    store = BufferStore(path)
+    assert set(store.load()) == {'a'}
+    store.put('b', {'n': 2})
+    store.checkpoint('a', done=[0])
+
+    sessions = BufferStore(path).load()
+    assert set(sessions) == {'a', 'b'}
+    assert sessions['a']['progress'] == {'done': [0]}
+    with open(path, 'rb') as file:
+        lines = file.read().splitlines()
+    assert lines[1] == b'{"op":"put","key":"torn","data":{"n"'
+    assert [json.loads(line)['key'] for line in lines[2:]] == ['b', 'a']
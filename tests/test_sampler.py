@@ -0,0 +1,74 @@
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sampler import FenwickTree, WeakSpotSampler  # noqa: E402
+
+
+def test_load_history_skips_other_digit_counts(tmp_path):
+    """桁数の違う履歴 (12 × 34 など) で木の更新が終わらなくならない"""
+    sampler = WeakSpotSampler(3, str(tmp_path / 'weights'))
+    sampler.load()
+    total = sampler.tree.total()
+    sampler.load_history([(12, 34, 1, 0, 2.0), (1234, 567, 1, 0, 2.0), (105, 234, 1, 0, 2.0)])
+    assert sampler.stats == {}
+    assert sampler.tree.total() == pytest.approx(total)
+
+    sampler.load_history([(123, 456, 2, 0, 3.0)])
+    assert len(sampler.stats) == 1
+    assert sampler.tree.total() > total
+
+
+def test_fenwick_add_rejects_out_of_range():
+    tree = FenwickTree.uniform(8, 1.0)
+    for i in (-1, -58380, 8):
+        with pytest.raises(IndexError):
+            tree.add(i, 1.0)
+    assert tree.total() == pytest.approx(8.0)
+
+
+def test_weak_pair_is_drawn_more_often(tmp_path):
+    """NUM_DIGITS=3 (約53万組) でも誤答の多い組み合わせが習得済みの組み合わせより多く出る"""
+    sampler = WeakSpotSampler(3, str(tmp_path / 'weights'))
+    sampler.load()
+    mastered = [(111 + i, 222) for i in range(20)]
+    for X, Y in mastered:
+        for _ in range(5):
+            sampler.update(X, Y, True, 2.0)
+    for _ in range(5):
+        sampler.update(999, 999, False, 2.0)
+
+    rng = random.Random(0)
+    counts = Counter(sampler.sample(rng) for _ in range(10000))
+    assert counts[(999, 999)] > 1000
+    assert counts[(999, 999)] > 5 * max(counts[pair] for pair in mastered)
+
+
+def test_weights_survive_save_and_load(tmp_path):
+    sampler = WeakSpotSampler(2, str(tmp_path / 'weights'))
+    sampler.load()
+    sampler.update(12, 34, False, 3.0)
+    sampler.save()
+
+    loaded = WeakSpotSampler(2, str(tmp_path / 'weights'))
+    assert loaded.load()
+    assert loaded.stats == sampler.stats
+    assert loaded.tree.total() == pytest.approx(sampler.tree.total())
+
+
+def test_load_history_adds_only_new_attempts(tmp_path):
+    """update済みの回答は二重に数えず、他の端末から取り込んだ分だけ加える"""
+    sampler = WeakSpotSampler(2, str(tmp_path / 'weights'))
+    sampler.load()
+    sampler.load_history([(12, 34, 2, 2, 3.0)])
+    sampler.update(12, 34, False, 3.0)  # この端末での回答 (履歴にも記録される)
+    sampler.load_history([(12, 34, 3, 2, 3.0)])
+    assert sampler.stats[sampler._index(12, 34)][:2] == [3, 1]
+
+    sampler.load_history([(12, 34, 5, 2, 3.0)])  # 取り込んだ2問はどちらも誤答
+    assert sampler.stats[sampler._index(12, 34)][:2] == [5, 3]
@@ -0,0 +1,141 @@
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from stats import P2Quantile, QUANTILES
+
+TRACE_MAX_BYTES = 50 * 1024 * 1024  # これを超えたら .1 に移して新しいファイルに書く (同期プロセスで増え続けないように)
+
+
+class PhaseMetrics:
+    """フェーズごとの回数・合計・最大・分位点 (Prometheusのsummary用)"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.quantiles = {p: P2Quantile(p) for p in QUANTILES}
+
+    def add(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.errors += error
+        for sketch in self.quantiles.values():
+            sketch.add(seconds)
+
+
+class Tracer:
+    """フェーズ単位の所要時間をJSONLに1行ずつ記録 (path=Noneなら集計のみ)"""
+    def __init__(self, path=None, metrics_path=None, max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.metrics_path = metrics_path
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.ids = itertools.count(1)
+        self.local = threading.local()  # スレッドごとの親スパン
+
+    def _write(self, record):
+        with self.lock:
+            metrics = self.metrics.get(record['name'])
+            if metrics is None:
+                metrics = self.metrics[record['name']] = PhaseMetrics()
+            # 例外に加え、notion_requestのように失敗を ok=False で返すスパンもエラーとして数える
+            metrics.add(record['duration_ms'] / 1000, 'error' in record or record.get('ok') is False)
+            if not self.path:
+                return
+            try:
+                if self.file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self.file = open(self.path, 'a', encoding='utf-8')
+                self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self.file.flush()
+                if self.file.tell() >= self.max_bytes:
+                    # 1世代だけ残してローテーション
+                    self.file.close()
+                    self.file = None
+                    os.replace(self.path, self.path + '.1')
+            except OSError as e:
+                print(f"トレースの記録に失敗しました: {e}")
+                self.path = None
+
+    def _record(self, span_id, parent, name, start, seconds, attrs):
+        record = {'run': self.run_id, 'id': span_id, 'parent': parent, 'name': name,
+                  'start': round(start, 6), 'duration_ms': round(seconds * 1000, 3),
+                  'thread': threading.current_thread().name}
+        record.update(attrs)
+        self._write(record)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """with内の処理時間を1スパンとして記録 (yieldした辞書に属性を追加できる)"""
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        parent = stack[-1] if stack else None
+        span_id = next(self.ids)
+        stack.append(span_id)
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs['error'] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - begin
+            stack.pop()
+            self._record(span_id, parent, name, start, seconds, attrs)
+
+    def add(self, name, seconds, **attrs):
+        """計測済みの区間を記録 (終了時刻を現在とみなす)"""
+        stack = getattr(self.local, 'stack', None)
+        self._record(next(self.ids), stack[-1] if stack else None, name, time.time() - seconds, seconds, attrs)
+
+    def write_metrics(self):
+        """Prometheusのtextfile形式で書き出す (node_exporterが途中のファイルを読まないよう置き換えで更新)"""
+        if not self.metrics_path:
+            return
+        lines = [
+            '# HELP quiz_phase_duration_seconds Time spent in each phase of the quiz app.',
+            '# TYPE quiz_phase_duration_seconds summary',
+        ]
+        with self.lock:
+            phases = sorted(self.metrics.items())
+        for name, m in phases:
+            for p, sketch in m.quantiles.items():
+                lines.append(f'quiz_phase_duration_seconds{{phase="{name}",quantile="{p}"}} {sketch.value():.6f}')
+            lines.append(f'quiz_phase_duration_seconds_sum{{phase="{name}"}} {m.total:.6f}')
+            lines.append(f'quiz_phase_duration_seconds_count{{phase="{name}"}} {m.count}')
+        lines += ['# HELP quiz_phase_duration_seconds_max Longest single span of each phase.',
+                  '# TYPE quiz_phase_duration_seconds_max gauge']
+        lines += [f'quiz_phase_duration_seconds_max{{phase="{name}"}} {m.max:.6f}' for name, m in phases]
+        lines += ['# HELP quiz_phase_errors_total Spans that raised or reported ok=false.',
+                  '# TYPE quiz_phase_errors_total counter']
+        lines += [f'quiz_phase_errors_total{{phase="{name}"}} {m.errors}' for name, m in phases]
+        lines += ['# HELP quiz_last_run_timestamp_seconds When the metrics were last written.',
+                  '# TYPE quiz_last_run_timestamp_seconds gauge',
+                  f'quiz_last_run_timestamp_seconds {time.time():.0f}']
+
+        tmp_path = self.metrics_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.metrics_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            print(f"メトリクスの書き出しに失敗しました: {e}")
+
+    def close(self):
+        self.write_metrics()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None